@@ -1,24 +1,34 @@
 import streamlit as st
 import os
 from dotenv import load_dotenv
-from src.conversation_engine import initialize_chatbot, load_chat_store, run_chatbot, display_messages
-from src.global_settings import CONVERSATION_FILE
+from src.conversation_engine import (
+    initialize_chatbot,
+    get_user_id,
+    load_chat_store,
+    stream_chatbot,
+    display_messages,
+)
+from src.memory import ConversationMemory
 
 load_dotenv()
 
+# Thông báo hiển thị khi agent gọi tool
+TOOL_STATUS = {
+    "dsm5_query": "🔎 Đang tra cứu tiêu chuẩn DSM-5...",
+    "save_score": "💾 Đang lưu kết quả đánh giá...",
+}
+
 
 def clear_chat_history():
-    """Xóa lịch sử hội thoại trong chat_store và CONVERSATION_FILE."""
-    # Xóa chat_store trong session_state
-    if "chat_store" in st.session_state:
-        st.session_state.chat_store = load_chat_store()  # Tạo chat_store mới, rỗng
-    # Xóa CONVERSATION_FILE
-    if os.path.exists(CONVERSATION_FILE):
-        try:
-            os.remove(CONVERSATION_FILE)
-            st.success("Đã xóa lịch sử hội thoại!")
-        except Exception as e:
-            st.error(f"Lỗi khi xóa file: {e}")
+    """Xóa lịch sử hội thoại của phiên hiện tại (trong bộ nhớ và trên đĩa)."""
+    st.session_state.memory.close()
+    st.session_state.memory = ConversationMemory()
+    # Xóa file lịch sử của phiên
+    try:
+        st.session_state.chat_store.clear()
+        st.success("Đã xóa lịch sử hội thoại!")
+    except Exception as e:
+        st.error(f"Lỗi khi xóa file: {e}")
     # Đặt lại trạng thái khởi tạo chatbot để hiển thị câu chào mới
     st.session_state.chatbot_initialized = False
     # Xóa nội dung chat_container bằng cách reruns ứng dụng
@@ -27,12 +37,15 @@ def clear_chat_history():
 
 st.title("MindCare Chatbot")
 
-# Cấu hình API key
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+# Cấu hình API key (không cần khi chạy với provider offline)
+if os.getenv("OPENAI_API_KEY"):
+    os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
 # Khởi tạo session state
 if "chat_store" not in st.session_state:
-    st.session_state.chat_store = load_chat_store()
+    st.session_state.chat_store = load_chat_store(get_user_id())
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
 if "agent_executor" not in st.session_state:
     st.session_state.agent_executor = None
 if "chatbot_initialized" not in st.session_state:
@@ -51,9 +64,10 @@ if not st.session_state.chatbot_initialized:
         st.session_state.chat_store
     )
     st.session_state.chatbot_initialized = True
-    # Hiển thị câu chào từ chatbot và lưu vào chat_store
-    welcome_message = "Chào bạn! Mình là chatbot hỗ trợ sức khỏe tâm thần, luôn ở đây để lắng nghe và trò chuyện cùng bạn. Hôm nay bạn cảm thấy thế nào? Bạn muốn chia sẻ điều gì đang xảy ra với mình hôm nay không?"
-    st.session_state.chat_store.add_ai_message(welcome_message)
+    # Hiển thị câu chào từ chatbot và lưu vào chat_store (chỉ khi bắt đầu cuộc trò chuyện mới)
+    if not st.session_state.chat_store.messages:
+        welcome_message = "Chào bạn! Mình là chatbot hỗ trợ sức khỏe tâm thần, luôn ở đây để lắng nghe và trò chuyện cùng bạn. Hôm nay bạn cảm thấy thế nào? Bạn muốn chia sẻ điều gì đang xảy ra với mình hôm nay không?"
+        st.session_state.chat_store.add_ai_message(welcome_message)
 
 # Hiển thị lịch sử hội thoại
 with chat_container:
@@ -67,11 +81,28 @@ if user_input and st.session_state.agent_executor:
     with chat_container:
         with st.chat_message("user"):
             st.markdown(user_input)
-        with st.spinner("Đang xử lý..."):
-            response = run_chatbot(
-                st.session_state.agent_executor,
-                st.session_state.chat_store,
-                user_input,
-            )
         with st.chat_message("assistant"):
-            st.markdown(response)
+            status = st.empty()
+
+            def reply_tokens():
+                # Hiển thị token ngay khi được sinh ra, kèm trạng thái gọi tool
+                streamed = False
+                for kind, payload in stream_chatbot(
+                    st.session_state.agent_executor,
+                    st.session_state.chat_store,
+                    user_input,
+                    st.session_state.memory,
+                    user_id=get_user_id(),
+                ):
+                    if kind == "token":
+                        streamed = True
+                        yield payload
+                    elif kind == "tool_start":
+                        status.caption(TOOL_STATUS.get(payload, f"Đang chạy {payload}..."))
+                    elif kind == "tool_end":
+                        status.empty()
+                    elif kind == "done" and not streamed:
+                        # Model không stream (ví dụ phản hồi được replay): hiển thị cả câu trả lời
+                        yield payload
+
+            st.write_stream(reply_tokens())
@@ -1,60 +1,63 @@
 import streamlit as st
-import json
 import pandas as pd
+from src.conversation_engine import get_user_id
+from src.score_store import get_score_store, TIME_FORMAT
 
-# File path for scores
-SCORES_FILE = "data/user_storage/scores.json"
+# Above this many points the chart shows daily/weekly aggregates instead of raw scores
+CHART_MAX_POINTS = 500
 
 
-# Load data from JSON file
-def load_scores():
-    try:
-        with open(SCORES_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return data
-    except FileNotFoundError:
-        return []
-
-
-# Prepare data for chart
-def prepare_data_for_chart(scores):
+# Load the current user's scores from the score store.
+# The cache key includes the store version (row count, last id), so new scores invalidate it.
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_scores(user_id, version):
+    scores = get_score_store().range(user_id)
     if not scores:
         return pd.DataFrame()
     df = pd.DataFrame(scores)
-    df['Time'] = pd.to_datetime(df['Time'])
-    # Format Time column to show only date and time
-    df['Time'] = df['Time'].dt.strftime('%Y-%m-%d %H:%M:%S')
-    return df
+    # Parse timestamps once and keep a sorted time index for fast lookups
+    df['Time'] = pd.to_datetime(df['Time'], format=TIME_FORMAT)
+    return df.set_index('Time').sort_index()
+
+
+# Prepare data for chart
+def prepare_data_for_chart(df):
+    if len(df) <= CHART_MAX_POINTS:
+        return df[['Score']]
+    # Aggregate long histories: daily buckets, or weekly ones for multi-year ranges
+    span = df.index[-1] - df.index[0]
+    rule = 'D' if span <= pd.Timedelta(days=CHART_MAX_POINTS) else 'W'
+    chart_data = df['Score'].resample(rule).agg(['mean', 'min', 'max']).dropna()
+    chart_data.columns = ['Mean score', 'Min score', 'Max score']
+    return chart_data
 
 
 # Display detailed information for a selected timestamp
-def display_details(scores, selected_time):
-    for entry in scores:
-        entry_time = pd.to_datetime(entry['Time'])
-        if entry_time == selected_time:
-            st.subheader(f"Details for {entry_time.strftime('%Y-%m-%d %H:%M:%S')}")
-            st.write(f"**Score:** {entry['Score']}")
-            st.write(f"**Level:** {entry['Level']}")
-            st.write(f"**Content:** {entry['Content']}")
-            st.write(f"**Total Guess:** {entry['Total guess']}")
-            break
-    else:
+def display_details(df, selected_time):
+    # Binary search on the sorted time index
+    position = df.index.searchsorted(selected_time, side='right') - 1
+    if position < 0 or df.index[position] != selected_time:
         st.write("No data available for the selected time.")
+        return
+    entry = df.iloc[position]
+    st.subheader(f"Details for {selected_time.strftime(TIME_FORMAT)}")
+    st.write(f"**Score:** {entry['Score']}")
+    st.write(f"**Level:** {entry['Level']}")
+    st.write(f"**Content:** {entry['Content']}")
+    st.write(f"**Total Guess:** {entry['Total guess']}")
 
 
 # Main function for User page
 st.title("🧠 Mental Health Tracking")
 
 # Load scores data
-scores = load_scores()
-
-# Prepare data for chart
-df = prepare_data_for_chart(scores)
+user_id = get_user_id()
+df = load_scores(user_id, get_score_store().version(user_id))
 
 # Display chart
 st.header("📊 Score History")
 if not df.empty:
-    chart_data = df[['Time', 'Score']].set_index('Time')
+    chart_data = prepare_data_for_chart(df)
     # Customize the line chart to mimic the image style
     st.line_chart(chart_data, use_container_width=True)
 
@@ -67,8 +70,7 @@ st.header("📅 View Details by Time")
 if df.empty:
     st.warning("No data available to select.")
 else:
-    timestamps = [pd.to_datetime(entry['Time']) for entry in scores]
-    # Add current time to options
+    timestamps = df.index.unique()
     selected_time = st.selectbox("Select a timestamp", options=timestamps,
-                                 format_func=lambda x: x.strftime('%Y-%m-%d %H:%M:%S'))
-    display_details(scores, selected_time)
+                                 format_func=lambda x: x.strftime(TIME_FORMAT))
+    display_details(df, selected_time)
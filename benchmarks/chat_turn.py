@@ -0,0 +1,306 @@
+"""
+Latency benchmarks for the chat turn hot path, runnable fully offline.
+
+Usage:
+    python -m benchmarks.chat_turn [--iterations 50] [--llm-latency 0.05]
+                                   [--embed-latency 0.02] [--output results.json]
+
+The LLM and embeddings are the deterministic fakes from src.providers with a
+fixed per-call latency, so the numbers show the time spent in our own code
+(retrieval, history and score persistence, agent orchestration) on top of
+the stubbed model calls. Everything is written to a temporary directory;
+tracing is turned off, so no spans are written and timed.
+
+Sections, each reporting p50/p95/p99 latency and throughput:
+    retrieval  dsm5_query context building: cold (index loaded from disk),
+               warm without and with the semantic cache
+    history    appending one turn at varying history lengths, to an open
+               session (warm) and to a freshly opened one (cold)
+    scores     saving one score at varying sizes of an imported scores.json
+    turns      full agent turns (LLM -> dsm5_query -> LLM -> save history),
+               cold (fresh process resources and session) and warm, plus
+               time to first token for streamed turns
+    shards     warm dsm5_query context building fanned out over 1 to 8
+               source shards, each as large as the corpus
+"""
+import os
+import io
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+
+# Before src.global_settings is imported: spans would go to data/traces in the repo
+os.environ["TRACING_ENABLED"] = "0"
+
+from src.chunk_store import ChunkStore
+from src.lexical_index import BM25Index
+from src.vector_backend import NumpyBackend, write_numpy_index
+from src.semantic_cache import SemanticCache
+from src.retrieval import HybridRetriever, Shard
+from src.sources import get_sources
+from src.conversation_store import JSONLChatMessageHistory
+from src.score_store import ScoreStore
+from src.global_settings import DEFAULT_USER_ID
+from src.providers import FakeChatModel, FakeEmbeddings
+from src.resources import get_resource, clear_resources
+from src.conversation_engine import initialize_chatbot, run_chatbot, stream_chatbot
+
+HISTORY_LENGTHS = (0, 100, 1000, 10000)
+SCORE_COUNTS = (0, 1000, 10000, 100000)
+SHARD_COUNTS = (1, 2, 4, 8)
+QUERY_TOPICS = [
+    "trầm cảm", "lo âu lan tỏa", "rối loạn lưỡng cực", "mất ngủ", "rối loạn hoảng sợ",
+    "ám ảnh cưỡng chế", "stress sau sang chấn", "rối loạn ăn uống", "tâm thần phân liệt",
+    "rối loạn nhân cách ranh giới",
+]
+QUERY_TEMPLATES = [
+    "Tiêu chuẩn chẩn đoán {} là gì?",
+    "Các triệu chứng của {} kéo dài bao lâu?",
+    "Làm sao phân biệt {} với các rối loạn khác?",
+    "Tôi thấy mình có dấu hiệu {}, tôi nên làm gì?",
+]
+
+
+def _summary(samples, wall=None):
+    values = np.asarray(samples) * 1000
+    wall = wall if wall is not None else sum(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+        "throughput_per_s": len(samples) / wall if wall else 0.0,
+    }
+
+
+def _timed(fn, n):
+    samples = []
+    start = time.perf_counter()
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - t0)
+    return _summary(samples, time.perf_counter() - start)
+
+
+def _queries(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        QUERY_TEMPLATES[rng.integers(len(QUERY_TEMPLATES))].format(QUERY_TOPICS[rng.integers(len(QUERY_TOPICS))])
+        + f" ({i})"
+        for i in range(n)
+    ]
+
+
+def _corpus(size):
+    """Texts of the real chunk stores if they have been built, otherwise synthetic chunks."""
+    stores = [ChunkStore(source.chunk_store_dir) for source in get_sources().values()]
+    records = [record for store in stores if store.exists() for record in store.iter_rows()]
+    if records:
+        return [record.text for record in records], [record.metadata for record in records], "chunk_store"
+    rng = np.random.default_rng(0)
+    words = " ".join(QUERY_TEMPLATES + QUERY_TOPICS).replace("{}", "").split()
+    texts = [" ".join(rng.choice(words, size=200)) for _ in range(size)]
+    return texts, [{"page": i // 4} for i in range(size)], "synthetic"
+
+
+def _build_index(root, texts, metadatas):
+    ids = [f"{os.path.basename(root)}-{i}" for i in range(len(texts))]
+    vectors = FakeEmbeddings().embed_documents(texts)
+    write_numpy_index(ids, vectors, texts, metadatas, path=os.path.join(root, "numpy"))
+    BM25Index().build(ids, texts, metadatas).save(os.path.join(root, "lexical_index.json"))
+
+
+def _shard(root):
+    return Shard(
+        os.path.basename(root),
+        NumpyBackend(os.path.join(root, "numpy")),
+        BM25Index.load(os.path.join(root, "lexical_index.json")),
+    )
+
+
+def _retriever(roots, embed_latency, cached):
+    version_files = [os.path.join(root, "index_version") for root in roots]
+    semantic_cache = SemanticCache(version_files=version_files) if cached else None
+    return HybridRetriever([_shard(root) for root in roots], FakeEmbeddings(latency=embed_latency), semantic_cache)
+
+
+def bench_retrieval(root, args):
+    queries = _queries(args.iterations)
+    retrievers = []
+
+    def cold_search(i):
+        retrievers.append(_retriever([root], args.embed_latency, cached=True))
+        retrievers[-1].search_context(queries[i])
+
+    cold = _timed(cold_search, args.cold_iterations)
+    uncached = _retriever([root], args.embed_latency, cached=False)
+    warm = _timed(lambda i: uncached.search_context(queries[i]), args.iterations)
+    cached = _retriever([root], args.embed_latency, cached=True)
+    repeated = queries[:5]
+    for query in repeated:
+        cached.search_context(query)
+    warm_cached = _timed(lambda i: cached.search_context(repeated[i % len(repeated)]), args.iterations)
+    for retriever in retrievers + [uncached, cached]:
+        retriever.close()
+    return {"cold": cold, "warm": warm, "warm_semantic_cache": warm_cached}
+
+
+def bench_shards(root, texts, metadatas, args):
+    roots = [os.path.join(root, f"shard-{i}") for i in range(max(SHARD_COUNTS))]
+    for shard_root in roots:
+        _build_index(shard_root, texts, metadatas)
+    queries = _queries(args.iterations, seed=2)
+    results = {}
+    for count in SHARD_COUNTS:
+        retriever = _retriever(roots[:count], args.embed_latency, cached=False)
+        results[str(count)] = _timed(lambda i: retriever.search_context(queries[i]), args.iterations)
+        retriever.close()
+    return results
+
+
+def _seed_history(root, session_id, length):
+    store = JSONLChatMessageHistory(session_id, root=root, fsync="never", compact_every=10 ** 9, keep=10 ** 9)
+    for i in range(length // 2):
+        store.add_user_message(f"Tin nhắn người dùng số {i}")
+        store.add_ai_message(f"Câu trả lời số {i} " + "nội dung " * 40)
+
+
+def bench_history(root, args):
+    results = {}
+    for length in HISTORY_LENGTHS:
+        session_id = f"history-{length}"
+        _seed_history(root, session_id, length)
+
+        def cold_turn(i):
+            store = JSONLChatMessageHistory(session_id, root=root)
+            store.add_user_message("xin chào")
+            store.add_ai_message("chào bạn")
+
+        cold = _timed(cold_turn, args.cold_iterations)
+        store = JSONLChatMessageHistory(session_id, root=root)
+
+        def warm_turn(i):
+            store.add_user_message("xin chào")
+            store.add_ai_message("chào bạn")
+
+        warm = _timed(warm_turn, args.iterations)
+        results[str(length)] = {"cold": cold, "warm": warm}
+    return results
+
+
+def bench_scores(root, args):
+    results = {}
+    for count in SCORE_COUNTS:
+        # Seed through the legacy scores.json import, as an existing install would be
+        legacy_json = os.path.join(root, f"scores-{count}.json")
+        with open(legacy_json, "w", encoding="utf-8") as f:
+            json.dump([
+                {"Time": f"2024-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}",
+                 "Score": i % 10, "Level": "tốt", "Content": "nội dung", "Total guess": "ổn"}
+                for i in range(count)
+            ], f, ensure_ascii=False)
+        store = ScoreStore(os.path.join(root, f"scores-{count}.sqlite3"), legacy_json=legacy_json)
+        results[str(count)] = _timed(
+            lambda i: store.add(DEFAULT_USER_ID, 7, "tốt", "Người dùng cảm thấy ổn", "ổn định"),
+            args.iterations,
+        )
+    return results
+
+
+def _install_fakes(root, args):
+    """Register the fake model and a retriever over root; returns the retriever."""
+    get_resource("chat_llm", lambda: FakeChatModel(latency=args.llm_latency, tool_call="dsm5_query"))
+    return get_resource("retriever", lambda: _retriever([root], args.embed_latency, cached=True))
+
+
+def bench_turns(root, index_root, args):
+    queries = _queries(args.iterations, seed=1)
+    history_root = os.path.join(root, "turns")
+    # clear_resources shuts down the shared pools but not a retriever's own
+    retrievers = []
+
+    def cold_turn(i):
+        clear_resources()
+        retrievers.append(_install_fakes(index_root, args))
+        agent_executor, chat_store = initialize_chatbot(
+            JSONLChatMessageHistory(f"cold-{i}", root=history_root)
+        )
+        run_chatbot(agent_executor, chat_store, queries[i])
+
+    cold = _timed(cold_turn, args.cold_iterations)
+
+    clear_resources()
+    retrievers.append(_install_fakes(index_root, args))
+    agent_executor, chat_store = initialize_chatbot(JSONLChatMessageHistory("warm", root=history_root))
+    warm = _timed(lambda i: run_chatbot(agent_executor, chat_store, queries[i]), args.iterations)
+
+    stream_store = JSONLChatMessageHistory("warm-stream", root=history_root)
+    first_tokens = []
+
+    def streamed_turn(i):
+        start = time.perf_counter()
+        first = None
+        for kind, _ in stream_chatbot(agent_executor, stream_store, queries[i]):
+            if kind == "token" and first is None:
+                first = time.perf_counter() - start
+        first_tokens.append(first if first is not None else time.perf_counter() - start)
+
+    warm_stream = _timed(streamed_turn, args.iterations)
+    warm_stream["time_to_first_token"] = _summary(first_tokens)
+    clear_resources()
+    for retriever in retrievers:
+        retriever.close()
+    return {"cold": cold, "warm": warm, "warm_stream": warm_stream}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--cold-iterations", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--corpus-size", type=int, default=500, help="synthetic chunks if no chunk store exists")
+    parser.add_argument("--only", choices=["retrieval", "history", "scores", "turns", "shards"], action="append")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    sections = args.only or ["retrieval", "history", "scores", "turns", "shards"]
+
+    texts, metadatas, corpus = _corpus(args.corpus_size)
+    report = {
+        "corpus": corpus,
+        "corpus_size": len(texts),
+        "iterations": args.iterations,
+        "cold_iterations": args.cold_iterations,
+        "llm_latency_s": args.llm_latency,
+        "embed_latency_s": args.embed_latency,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        index_root = os.path.join(tmp, "index")
+        _build_index(index_root, texts, metadatas)
+        # The agent and tools log to stdout; keep it out of the JSON report
+        with contextlib.redirect_stdout(io.StringIO()):
+            if "retrieval" in sections:
+                report["retrieval"] = bench_retrieval(index_root, args)
+            if "history" in sections:
+                report["history"] = bench_history(os.path.join(tmp, "history"), args)
+            if "scores" in sections:
+                report["scores"] = bench_scores(tmp, args)
+            if "turns" in sections:
+                report["turns"] = bench_turns(tmp, index_root, args)
+            if "shards" in sections:
+                report["shards"] = bench_shards(os.path.join(tmp, "shards"), texts, metadatas, args)
+
+    output = json.dumps(report, indent=4)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare the Chroma (HNSW) and NumPy vector backends on a built source shard.
+
+Usage:
+    python -m benchmarks.vector_backends [--queries 200] [--k 5] [--source dsm5] [--output results.json]
+
+Queries are stored chunk embeddings with Gaussian noise added, so no embedding
+API calls are made. Recall@k is measured against exact float32 search.
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from src.global_settings import INDEX_STORAGE
+from src.vector_backend import ChromaBackend, NumpyBackend, write_numpy_index
+from src.resources import get_collection
+from src.sources import get_source
+
+
+def _percentiles(samples):
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+def _dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def _run(backend, queries, truth, k):
+    latencies = []
+    found = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        hits = backend.query([query.tolist()], k)[0]
+        latencies.append(time.perf_counter() - start)
+        found += len({hit["id"] for hit in hits} & expected)
+    result = _percentiles(latencies)
+    result["recall_at_k"] = found / (len(queries) * k)
+
+    start = time.perf_counter()
+    backend.query(queries.tolist(), k)
+    elapsed = time.perf_counter() - start
+    result["batch_qps"] = len(queries) / elapsed
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--source", default="dsm5", help="source whose shard is benchmarked")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    source = get_source(args.source)
+    exact = NumpyBackend(source.numpy_index_dir)
+    if exact.dtype != "float32":
+        raise SystemExit("Benchmark needs the float32 NumPy index; rebuild with NUMPY_INDEX_DTYPE='float32'")
+    matrix = np.asarray(exact.matrix, dtype=np.float32)
+
+    rng = np.random.default_rng(0)
+    rows = rng.integers(0, len(matrix), size=args.queries)
+    queries = matrix[rows] + rng.normal(0, args.noise, size=(args.queries, matrix.shape[1])).astype(np.float32)
+    truth = [{hit["id"] for hit in hits} for hits in exact.query(queries.tolist(), args.k)]
+
+    report = {"corpus_size": len(matrix), "dimension": matrix.shape[1], "queries": args.queries, "k": args.k}
+
+    chroma = ChromaBackend(get_collection(source.collection_name))
+    chroma.query([queries[0].tolist()], args.k)  # load the HNSW index before timing
+    report["chroma"] = _run(chroma, queries, truth, args.k)
+    report["chroma"]["disk_bytes"] = _dir_size(INDEX_STORAGE)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in ("float32", "float16", "int8"):
+            path = os.path.join(tmp, dtype)
+            write_numpy_index(exact.ids, matrix, exact.texts, exact.metadatas, path=path, dtype=dtype)
+            backend = NumpyBackend(path)
+            report[f"numpy_{dtype}"] = _run(backend, queries, truth, args.k)
+            report[f"numpy_{dtype}"]["matrix_bytes"] = backend.nbytes
+
+    output = json.dumps(report, indent=4)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
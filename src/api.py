@@ -0,0 +1,198 @@
+"""
+Headless ASGI chat service over the same conversation engine as the Streamlit app.
+
+Run with:
+    python -m src.api            (or: uvicorn src.api:app)
+
+Endpoints:
+    POST   /sessions                          create a session -> {"session_id"}
+    GET    /sessions/{sid}/messages           chat history
+    POST   /sessions/{sid}/messages           {"message", "user_id"?} -> {"reply"} after the turn
+    POST   /sessions/{sid}/messages/stream    {"message", "user_id"?} -> text/event-stream with
+                                              token, tool_start, tool_end and done events
+    GET    /users/{user_id}/scores            score history, optional ?start=&end= as
+                                              "YYYY-MM-DD[ HH:MM:SS]", both inclusive
+    DELETE /sessions/{sid}                    close the session (history is kept on disk)
+    GET    /health, GET /metrics
+
+Scores saved during a turn belong to the given user_id (default DEFAULT_USER_ID),
+not to the session: a user keeps one score history across sessions.
+
+Turns run on the agent's async path (astream_chatbot), so one process serves
+many concurrent conversations while they wait on the LLM; turns of the same
+session are serialized.
+"""
+import json
+import logging
+import contextlib
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from src.global_settings import API_HOST, API_PORT, DEFAULT_USER_ID
+from src.conversation_engine import initialize_chatbot, astream_chatbot, warm_up
+from src.conversation_store import is_valid_session_id
+from src.score_store import get_score_store
+from src.session_manager import SessionManager
+from src.tracing import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+sessions = SessionManager()
+
+
+def _error(status: int, message: str) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status)
+
+
+async def _session(request: Request):
+    try:
+        return await sessions.aget(request.path_params["session_id"])
+    except ValueError as e:
+        return _error(400, str(e))
+
+
+async def _message(request: Request):
+    """(message, user_id) of a turn request, or an error response."""
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        return _error(400, "Body must be JSON")
+    if not isinstance(body, dict):
+        return _error(400, "Body must be a JSON object")
+    message = body.get("message")
+    if not isinstance(message, str) or not message.strip():
+        return _error(400, 'Body must contain a non-empty "message"')
+    user_id = body.get("user_id", DEFAULT_USER_ID)
+    if not isinstance(user_id, str) or not is_valid_session_id(user_id):
+        return _error(400, 'Invalid "user_id"')
+    return message, user_id
+
+
+async def create_session(request: Request):
+    session_id = sessions.new_session_id()
+    await sessions.aget(session_id)
+    return JSONResponse({"session_id": session_id}, status_code=201)
+
+
+async def get_messages(request: Request):
+    session = await _session(request)
+    if isinstance(session, JSONResponse):
+        return session
+    return JSONResponse([
+        {"role": message.type, "content": message.content}
+        for message in session.chat_store.messages
+    ])
+
+
+async def send_message(request: Request):
+    session = await _session(request)
+    if isinstance(session, JSONResponse):
+        return session
+    turn_input = await _message(request)
+    if isinstance(turn_input, JSONResponse):
+        return turn_input
+    message, user_id = turn_input
+
+    agent_executor, chat_store = initialize_chatbot(session.chat_store)
+    reply = ""
+    async with session.lock:
+        async for kind, payload in astream_chatbot(
+            agent_executor, chat_store, message, session.memory, user_id=user_id
+        ):
+            if kind == "done":
+                reply = payload
+    return JSONResponse({"reply": reply})
+
+
+def _sse(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def stream_message(request: Request):
+    session = await _session(request)
+    if isinstance(session, JSONResponse):
+        return session
+    turn_input = await _message(request)
+    if isinstance(turn_input, JSONResponse):
+        return turn_input
+    message, user_id = turn_input
+
+    agent_executor, chat_store = initialize_chatbot(session.chat_store)
+
+    async def events():
+        async with session.lock:
+            turn = astream_chatbot(agent_executor, chat_store, message, session.memory, user_id=user_id)
+            try:
+                async for kind, payload in turn:
+                    yield _sse(kind, payload)
+            except Exception as e:
+                logger.exception("Streamed turn failed")
+                yield _sse("error", str(e))
+            finally:
+                # Also runs when the client disconnects, cancelling the turn
+                await turn.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def get_scores(request: Request):
+    user_id = request.path_params["user_id"]
+    start = request.query_params.get("start")
+    end = request.query_params.get("end")
+    scores = await run_in_threadpool(get_score_store().range, user_id, start, end)
+    return JSONResponse(scores)
+
+
+async def delete_session(request: Request):
+    sessions.close(request.path_params["session_id"])
+    return JSONResponse({"closed": True})
+
+
+async def health(request: Request):
+    return JSONResponse({"status": "ok", "sessions": len(sessions)})
+
+
+async def get_metrics(request: Request):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    try:
+        await run_in_threadpool(warm_up)
+    except Exception as e:
+        logger.warning("Warm-up failed: %s", e)
+    sessions.start()
+    yield
+    await sessions.stop()
+
+
+app = Starlette(
+    routes=[
+        Route("/sessions", create_session, methods=["POST"]),
+        Route("/sessions/{session_id}", delete_session, methods=["DELETE"]),
+        Route("/sessions/{session_id}/messages", get_messages, methods=["GET"]),
+        Route("/sessions/{session_id}/messages", send_message, methods=["POST"]),
+        Route("/sessions/{session_id}/messages/stream", stream_message, methods=["POST"]),
+        Route("/users/{user_id}/scores", get_scores, methods=["GET"]),
+        Route("/health", health, methods=["GET"]),
+        Route("/metrics", get_metrics, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    uvicorn.run(app, host=API_HOST, port=API_PORT)
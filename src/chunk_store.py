@@ -0,0 +1,229 @@
+import os
+import json
+import shutil
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+
+
+STORE_VERSION = 2
+
+MANIFEST_NAME = "manifest.json"
+ROWS_NAME = "chunks.jsonl"
+SECTIONS_NAME = "sections.jsonl"
+VECTORS_NAME = "embeddings.f32"
+
+
+class ChunkRecord:
+    """
+    Compact chunk row: the text, where it came from and the id of its section.
+    Summaries live once per section in the sections table and vectors only in
+    embeddings.f32, never in the row.
+    """
+
+    __slots__ = ("text", "source", "page", "page_end", "section_id", "embedded")
+
+    def __init__(self, text: str, source: str, page: int, page_end: Optional[int] = None,
+                 section_id: Optional[str] = None, embedded: bool = False):
+        self.text = text
+        self.source = source
+        self.page = page
+        self.page_end = page if page_end is None else page_end
+        self.section_id = section_id
+        self.embedded = embedded
+
+    @classmethod
+    def from_document(cls, document: Document, embedded: bool = False) -> "ChunkRecord":
+        metadata = document.metadata
+        return cls(
+            document.page_content,
+            metadata.get("id"),
+            metadata.get("page", 0),
+            metadata.get("page_end"),
+            metadata.get("section_id"),
+            embedded,
+        )
+
+    @classmethod
+    def from_row(cls, row: dict) -> "ChunkRecord":
+        return cls(row["text"], row["source"], row["page"], row["page_end"], row["section_id"], row["embedded"])
+
+    def to_row(self) -> dict:
+        return {
+            "text": self.text,
+            "source": self.source,
+            "page": self.page,
+            "page_end": self.page_end,
+            "section_id": self.section_id,
+            "embedded": self.embedded,
+        }
+
+    @property
+    def metadata(self) -> dict:
+        # Only scalar fields, so it can be passed to Chroma as is
+        metadata = {"id": self.source, "page": self.page, "page_end": self.page_end}
+        if self.section_id is not None:
+            metadata["section_id"] = self.section_id
+        return metadata
+
+    def to_document(self) -> Document:
+        return Document(page_content=self.text, metadata=self.metadata)
+
+
+class ChunkStore:
+    """
+    Versioned on-disk store for processed chunks.
+
+    Layout of the store directory:
+        manifest.json   store version, source file hashes, pipeline parameters,
+                        row count and embedding dimension
+        chunks.jsonl    one ChunkRecord row per chunk
+        sections.jsonl  one row per section: {"id", "source", "title", "page",
+                        "page_end", "summary"}, referenced by the chunks' section_id
+        embeddings.f32  row-major float32 matrix, memory-mapped on read
+
+    Rows are read lazily, so callers can stream chunks without loading the whole
+    corpus into memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._manifest = None
+
+    @property
+    def manifest(self) -> Optional[dict]:
+        if self._manifest is None:
+            try:
+                with open(os.path.join(self.path, MANIFEST_NAME), "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                return None
+        return self._manifest
+
+    def exists(self) -> bool:
+        return self.manifest is not None
+
+    def is_current(self, expected: dict) -> bool:
+        """Check the store was produced by the same sources and pipeline parameters."""
+        manifest = self.manifest
+        if manifest is None or manifest.get("version") != STORE_VERSION:
+            return False
+        return (
+            manifest.get("sources") == expected.get("sources")
+            and manifest.get("params") == expected.get("params")
+        )
+
+    def __len__(self) -> int:
+        manifest = self.manifest
+        return manifest["count"] if manifest else 0
+
+    def iter_rows(self) -> Iterator[ChunkRecord]:
+        with open(os.path.join(self.path, ROWS_NAME), "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield ChunkRecord.from_row(json.loads(line))
+
+    def __iter__(self) -> Iterator[Document]:
+        for record in self.iter_rows():
+            yield record.to_document()
+
+    def sections(self) -> Dict[str, dict]:
+        """Section rows (title, page range and summary) keyed by section id."""
+        try:
+            with open(os.path.join(self.path, SECTIONS_NAME), "r", encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return {}
+        return {row["id"]: row for row in rows}
+
+    def embeddings(self) -> Optional[np.ndarray]:
+        """Memory-mapped (count, dimension) float32 matrix, or None if nothing was embedded."""
+        manifest = self.manifest
+        if not manifest or not manifest.get("dimension") or not manifest["count"]:
+            return None
+        return np.memmap(
+            os.path.join(self.path, VECTORS_NAME),
+            dtype=np.float32,
+            mode="r",
+            shape=(manifest["count"], manifest["dimension"]),
+        )
+
+    def iter_records(self) -> Iterator[Tuple[Document, Optional[np.ndarray]]]:
+        """Yield (document, embedding) pairs; embedding is None for rows without a vector."""
+        matrix = self.embeddings()
+        for i, record in enumerate(self.iter_rows()):
+            vector = matrix[i] if matrix is not None and record.embedded else None
+            yield record.to_document(), vector
+
+    def writer(self, manifest: dict) -> "ChunkStoreWriter":
+        return ChunkStoreWriter(self, manifest)
+
+
+class ChunkStoreWriter:
+    """
+    Append chunks to a fresh copy of the store and swap it in on commit.
+
+    Used as a context manager; the previous store stays readable until the new
+    one is complete, and an exception leaves it untouched.
+    """
+
+    def __init__(self, store: ChunkStore, manifest: dict):
+        self.store = store
+        self.manifest = dict(manifest)
+        self.tmp_path = store.path + ".tmp"
+        self.count = 0
+        self.dimension = None
+
+    def __enter__(self):
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+        self._rows = open(os.path.join(self.tmp_path, ROWS_NAME), "w", encoding="utf-8")
+        self._sections = open(os.path.join(self.tmp_path, SECTIONS_NAME), "w", encoding="utf-8")
+        self._vectors = open(os.path.join(self.tmp_path, VECTORS_NAME), "wb")
+        return self
+
+    def append(self, document: Document, embedding: Optional[List[float]] = None) -> None:
+        if embedding is not None and self.dimension is None:
+            self.dimension = len(embedding)
+        record = ChunkRecord.from_document(document, embedded=embedding is not None)
+        self._rows.write(json.dumps(record.to_row(), ensure_ascii=False) + "\n")
+        if self.dimension is not None:
+            if self.count and self._vectors.tell() == 0:
+                # First vector arrived after unembedded rows; pad those with zeros
+                np.zeros((self.count, self.dimension), dtype=np.float32).tofile(self._vectors)
+            vector = embedding if embedding is not None else np.zeros(self.dimension)
+            np.asarray(vector, dtype=np.float32).tofile(self._vectors)
+        self.count += 1
+
+    def extend(self, documents: List[Document], embeddings: List[Optional[List[float]]]) -> None:
+        for document, embedding in zip(documents, embeddings):
+            self.append(document, embedding)
+
+    def add_section(self, section: dict) -> None:
+        """Store a section row; chunks refer to it by its "id"."""
+        self._sections.write(json.dumps(section, ensure_ascii=False) + "\n")
+
+    def __exit__(self, exc_type, exc, tb):
+        self._rows.close()
+        self._sections.close()
+        self._vectors.close()
+        if exc_type is not None:
+            shutil.rmtree(self.tmp_path, ignore_errors=True)
+            return False
+
+        self.manifest.update({
+            "version": STORE_VERSION,
+            "count": self.count,
+            "dimension": self.dimension,
+        })
+        with open(os.path.join(self.tmp_path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=4)
+
+        old_path = self.store.path + ".old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(self.store.path):
+            os.replace(self.store.path, old_path)
+        os.replace(self.tmp_path, self.store.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        self.store._manifest = None
+        return False
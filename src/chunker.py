@@ -0,0 +1,333 @@
+"""
+Structure-aware chunking of the DSM-5 criteria text.
+
+Pages are joined into one stream of lines and cut at disorder headings, so a
+disorder's criteria stay together even when they run across a page break. A
+heading is a numbered title ("1.2.2 Rối loạn phát âm"), possibly wrapped over
+several lines, together with the code line under it ("Mã số: 315.39 (F80.0)"),
+and the section title is the whole heading. Within a section, lines are grouped
+into blocks that start at a criterion ("A.", "B.", ...) or a note such as
+"Biệt định", and blocks are packed into chunks of at most CHUNK_SIZE tokens.
+Continuation chunks repeat the section heading so they still name the disorder.
+Token counts per line are cached by page hash, so rebuilding over unchanged
+pages does not re-tokenize them.
+"""
+import os
+import re
+import json
+import hashlib
+from typing import Iterable, Iterator, List, Optional
+from langchain.docstore.document import Document
+
+from src.global_settings import CHUNK_SIZE, CHUNK_OVERLAP, TOKEN_COUNT_CACHE_FILE
+from src.tokens import count_tokens, TOKENIZER_NAME
+
+CHUNKER_VERSION = "dsm5-sections-2"
+
+# "Mã số: 315.39 (F80.0)", "Mã số 301.22", "Mã: 308.3 (F43.0)", "Mã số: 316 (F54)"
+_CODE_LINE = re.compile(r"^Mã(?: số)?\s*:?\s*\d[\d.\s]*(?:\([A-Z]\d[\dA-Za-z.]*\))?$")
+# "1.2.2 Rối loạn phát âm"; one or two digits per part, unlike codes such as "314.01"
+_NUMBERED_TITLE = re.compile(r"^\d{1,2}(?:\.\d{1,2})+\s+(\S)")
+# Chapter titles: "1 RỐI LOẠN PHÁT TRIỂN THẦN KINH", "8  CÁC RỐI LOẠN PHÂN LY (Dissociative Disorder)"
+_CHAPTER_TITLE = re.compile(r"^\d{1,2}\s+([^(]*\w[^(]*)")
+# Unnumbered sub-headings such as "Rối loạn lưỡng cực I"; case-sensitive, since
+# "chứng (đặc biệt là ..." in running text is not a heading
+_HEADING_NAME = re.compile(r"^(Rối loạn|Hội chứng|Chứng|Mất trí|Sa sút|Tâm thần phân liệt)\b")
+_CRITERION = re.compile(r"^[A-I]\.\s")
+_NOTE = re.compile(r"^(Biệt định|Ghi chú|Lưu ý|Ghi mã|Mã hóa|Chú ý)\b", re.IGNORECASE)
+_PAGE_NUMBER = re.compile(r"^\d{1,4}$")
+MAX_HEADING_CHARS = 120
+MAX_HEADING_WORDS = 14
+MAX_TITLE_LINES = 3
+
+
+def is_code_line(line: str) -> bool:
+    """The "Mã số: ..." line giving a disorder's codes."""
+    return bool(_CODE_LINE.match(line))
+
+
+def _is_upper(text: str) -> bool:
+    return text.upper() == text
+
+
+def _is_chapter(line: str) -> bool:
+    match = _CHAPTER_TITLE.match(line)
+    return bool(match) and _is_upper(match.group(1))
+
+
+def is_title(line: str, next_line: str = "") -> bool:
+    """
+    The first line of a disorder or chapter title. An unnumbered disorder name
+    only counts when criteria or a code line follow it directly.
+    """
+    if len(line) > MAX_HEADING_CHARS:
+        return False
+    match = _NUMBERED_TITLE.match(line)
+    if match:
+        return match.group(1).isupper()
+    if _is_chapter(line):
+        return True
+    return bool(_HEADING_NAME.match(line)) and len(line.split()) <= MAX_HEADING_WORDS \
+        and not line.endswith((".", ":", ",", ";")) \
+        and bool(_CRITERION.match(next_line) or is_code_line(next_line))
+
+
+def is_heading(line: str, next_line: str = "") -> bool:
+    """A line that starts a heading: a title, or a code line not preceded by one."""
+    return is_title(line, next_line) or is_code_line(line)
+
+
+def _continues_title(title: str, line: str) -> bool:
+    """Whether line is the wrapped remainder of a title, e.g. "Vocal Tic Disorder)"."""
+    if _CRITERION.match(line) or _NOTE.match(line) or is_code_line(line) or is_title(line):
+        return False
+    if len(title) + len(line) > 2 * MAX_HEADING_CHARS:
+        return False
+    return (
+        title.count("(") > title.count(")")
+        or line.startswith("(")
+        or line[:1].islower()
+        or line.count("(") > line.count(")")
+        or (_is_chapter(title) and _is_upper(line.split("(")[0]))
+    )
+
+
+class TokenCountCache:
+    """Per-line token counts of pages, keyed by page hash and persisted as JSON."""
+
+    def __init__(self, path: str = TOKEN_COUNT_CACHE_FILE, tokenizer: str = TOKENIZER_NAME):
+        self.path = path
+        self.tokenizer = tokenizer
+        self.pages = {}
+        self._dirty = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            if payload.get("tokenizer") == tokenizer:
+                self.pages = payload["pages"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
+    def line_counts(self, lines: List[str]) -> List[int]:
+        key = hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+        counts = self.pages.get(key)
+        if counts is None or len(counts) != len(lines):
+            counts = [count_tokens(line) for line in lines]
+            self.pages[key] = counts
+            self._dirty = True
+        return counts
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"tokenizer": self.tokenizer, "pages": self.pages}, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+class _Line:
+    __slots__ = ("text", "page", "tokens")
+
+    def __init__(self, text: str, page: int, tokens: int):
+        self.text = text
+        self.page = page
+        self.tokens = tokens
+
+
+class Section:
+    """A heading and the lines under it, possibly spanning several pages."""
+
+    def __init__(self, source: str, carried: Iterable[_Line] = ()):
+        self.source = source
+        self.heading: List[str] = []
+        # Lines of headings directly above this one (chapter, then disorder)
+        self.lines: List[_Line] = list(carried)
+        self.has_body = False
+        # Until the first body line, wrapped title lines and the code line join the heading
+        self.heading_open = False
+
+    @property
+    def title(self) -> str:
+        return " ".join(self.heading)
+
+    def add_heading_line(self, line: _Line) -> None:
+        self.heading.append(line.text)
+        self.lines.append(line)
+        # The code line ends the heading
+        self.heading_open = not is_code_line(line.text)
+
+    def continues_heading(self, text: str) -> bool:
+        if not self.heading_open:
+            return False
+        if is_code_line(text):
+            return True
+        return len(self.heading) < MAX_TITLE_LINES and _continues_title(self.title, text)
+
+    def add_line(self, line: _Line) -> None:
+        self.lines.append(line)
+        self.has_body = True
+        self.heading_open = False
+
+    @property
+    def page_start(self) -> int:
+        return self.lines[0].page
+
+    @property
+    def page_end(self) -> int:
+        return self.lines[-1].page
+
+    @property
+    def id(self) -> str:
+        """
+        Stable id of the section, referenced by its chunks' section_id. The text is
+        part of the key, since two sections can share a page and a title.
+        """
+        key = "\x1f".join([self.source, str(self.page_start), self.title] + [line.text for line in self.lines])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+    def row(self, summary: str) -> dict:
+        """Row of the chunk store's sections table."""
+        return {
+            "id": self.id,
+            "source": self.source,
+            "title": self.title,
+            "page": self.page_start,
+            "page_end": self.page_end,
+            "summary": summary,
+        }
+
+    def _blocks(self) -> List[List[_Line]]:
+        blocks: List[List[_Line]] = []
+        for line in self.lines:
+            if not blocks or _CRITERION.match(line.text) or _NOTE.match(line.text):
+                blocks.append([])
+            blocks[-1].append(line)
+        return blocks
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Document]:
+        """Pack the section's blocks into chunk Documents of at most chunk_size tokens."""
+        heading = self.title
+        heading_tokens = count_tokens(heading) + 1 if heading else 0
+        pieces: List[List[_Line]] = []
+        current: List[_Line] = []
+        used = 0
+
+        def budget() -> int:
+            # Continuation chunks are prefixed with the heading
+            return chunk_size - (heading_tokens if pieces and heading else 0)
+
+        # Lines too long for any chunk are split to fit next to the heading
+        part_budget = max(1, chunk_size - 2 * heading_tokens)
+        for block in self._blocks():
+            block_tokens = sum(line.tokens + 1 for line in block)
+            # Never leave the heading and its short lead-in as a chunk of their own
+            lead_only = not pieces and used <= chunk_size // 8
+            if current and used + block_tokens > budget() and not lead_only:
+                pieces.append(current)
+                current, used = [], 0
+            if used + block_tokens <= budget():
+                current.extend(block)
+                used += block_tokens
+                continue
+            # A block too large for one chunk is cut at line boundaries
+            for line in block:
+                for part in _split_line(line, part_budget, overlap):
+                    if current and used + part.tokens + 1 > budget():
+                        pieces.append(current)
+                        current, used = [], 0
+                    current.append(part)
+                    used += part.tokens + 1
+        if current:
+            pieces.append(current)
+
+        section_id = self.id
+        documents = []
+        for i, piece in enumerate(pieces):
+            text = "\n".join(line.text for line in piece)
+            if i > 0 and heading:
+                text = f"{heading}\n{text}"
+            documents.append(Document(
+                page_content=text,
+                metadata={
+                    "id": self.source,
+                    "page": piece[0].page,
+                    "page_end": piece[-1].page,
+                    "section_id": section_id,
+                },
+            ))
+        return documents
+
+
+def _split_line(line: _Line, budget: int, overlap: int) -> List[_Line]:
+    """Split a line longer than budget tokens into word ranges with overlap tokens repeated."""
+    if line.tokens <= budget:
+        return [line]
+    words = line.text.split()
+    per_word = max(line.tokens / max(len(words), 1), 1e-6)
+    size = max(1, int(budget / per_word))
+    step = max(1, size - int(overlap / per_word))
+    parts = []
+    for start in range(0, len(words), step):
+        text = " ".join(words[start:start + size])
+        parts.append(_Line(text, line.page, count_tokens(text)))
+        if start + size >= len(words):
+            break
+    return parts
+
+
+def _page_lines(pages: Iterable[Document], cache: TokenCountCache) -> Iterator[tuple]:
+    """(source, line) for every text line of the pages, page numbers dropped."""
+    for page in pages:
+        lines = [line.strip() for line in page.page_content.splitlines()]
+        lines = [line for line in lines if line and not _PAGE_NUMBER.match(line)]
+        page_number = page.metadata.get("page", 0)
+        for text, tokens in zip(lines, cache.line_counts(lines)):
+            yield page.metadata.get("id"), _Line(text, page_number, tokens)
+
+
+def _with_next(items: Iterator[tuple]) -> Iterator[tuple]:
+    """(source, line, next line of the same source or "")."""
+    previous = None
+    for item in items:
+        if previous is not None:
+            yield previous + (item[1].text if item[0] == previous[0] else "",)
+        previous = item
+    if previous is not None:
+        yield previous + ("",)
+
+
+def iter_sections(pages: Iterable[Document], cache: Optional[TokenCountCache] = None) -> Iterator[Section]:
+    """
+    Group a stream of page Documents into sections, yielding each section as soon
+    as the next heading (or the end of its source) is reached.
+    """
+    cache = cache if cache is not None else TokenCountCache()
+    section: Optional[Section] = None
+    for source, line, next_text in _with_next(_page_lines(pages, cache)):
+        text = line.text
+        if section is not None and section.source != source:
+            if section.lines:
+                yield section
+            section = None
+        if section is not None and section.continues_heading(text):
+            section.add_heading_line(line)
+            continue
+        if is_heading(text, next_text):
+            carried = []
+            if section is not None and section.heading and not section.has_body:
+                carried = section.lines
+            elif section is not None and section.lines:
+                yield section
+            section = Section(source, carried)
+            section.add_heading_line(line)
+            continue
+        if section is None:
+            # Text before the first heading (front matter)
+            section = Section(source)
+        section.add_line(line)
+    if section is not None and section.lines:
+        yield section
+    cache.save()
@@ -0,0 +1,123 @@
+from typing import Dict, List, Optional
+import numpy as np
+
+from src.tokens import count_tokens
+
+# Shortest suffix/prefix match (in characters) treated as splitter overlap
+MIN_OVERLAP_CHARS = 30
+# Longest overlap searched; split lines overlap by CHUNK_OVERLAP (20) tokens
+MAX_OVERLAP_CHARS = 400
+# Word n-gram size and containment ratio for near-duplicate detection
+SHINGLE_SIZE = 8
+DUPLICATE_CONTAINMENT = 0.8
+
+
+def mmr(query_embedding, hits: List[dict], vectors: Dict[str, np.ndarray],
+        k: int, lambda_mult: float) -> List[dict]:
+    """
+    Maximal marginal relevance: pick k hits, each maximizing
+    lambda * sim(query, hit) - (1 - lambda) * max sim(hit, already picked).
+    Hits without a stored vector keep their rank order after the others.
+    """
+    with_vectors = [hit for hit in hits if hit["id"] in vectors]
+    without_vectors = [hit for hit in hits if hit["id"] not in vectors]
+    if not with_vectors:
+        return hits[:k]
+
+    matrix = np.stack([vectors[hit["id"]] for hit in with_vectors]).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query /= np.linalg.norm(query) + 1e-12
+    relevance = matrix @ query
+    similarity = matrix @ matrix.T
+
+    selected: List[int] = []
+    candidates = list(range(len(with_vectors)))
+    while candidates and len(selected) < k:
+        if selected:
+            redundancy = similarity[np.ix_(candidates, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(candidates))
+        scores = lambda_mult * relevance[candidates] - (1 - lambda_mult) * redundancy
+        best = candidates[int(np.argmax(scores))]
+        selected.append(best)
+        candidates.remove(best)
+    picked = [with_vectors[i] for i in selected]
+    return (picked + without_vectors)[:k]
+
+
+def _shingles(text: str) -> set:
+    words = text.split()
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of a that is also a prefix of b."""
+    for n in range(min(len(a), len(b), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+
+def merge_overlapping(hits: List[dict]) -> List[dict]:
+    """
+    Drop hits whose text is mostly contained in an earlier hit, and merge
+    neighbouring chunks that share a splitter overlap into one passage.
+    """
+    kept: List[dict] = []
+    shingles: List[set] = []
+    for hit in hits:
+        hit_shingles = _shingles(hit["text"])
+        if any(len(hit_shingles & other) >= DUPLICATE_CONTAINMENT * len(hit_shingles) for other in shingles):
+            continue
+
+        merged = False
+        for i, other in enumerate(kept):
+            for first, second in ((other, hit), (hit, other)):
+                n = _overlap(first["text"], second["text"])
+                if n:
+                    kept[i] = dict(other, text=first["text"] + second["text"][n:])
+                    shingles[i] = _shingles(kept[i]["text"])
+                    merged = True
+                    break
+            if merged:
+                break
+        if not merged:
+            kept.append(hit)
+            shingles.append(hit_shingles)
+    return kept
+
+
+def fit_token_budget(hits: List[dict], budget: int) -> List[str]:
+    """Take passages in order until budget tokens are used, truncating the last one."""
+    passages = []
+    remaining = budget
+    for hit in hits:
+        if remaining <= 0:
+            break
+        text = hit["text"]
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            # Cut proportionally, then trim until it fits
+            text = text[:max(1, len(text) * remaining // tokens)]
+            while text and count_tokens(text) > remaining:
+                text = text[:int(len(text) * 0.9)]
+            if not text:
+                break
+            tokens = count_tokens(text)
+        passages.append(text)
+        remaining -= tokens
+    return passages
+
+
+def build_context(query_embedding: Optional[list], hits: List[dict],
+                  vectors: Dict[str, np.ndarray], k: int, lambda_mult: float,
+                  budget: int) -> List[str]:
+    """Diversify over-fetched hits with MMR, merge overlaps and fit the token budget."""
+    if query_embedding is not None:
+        hits = mmr(query_embedding, hits, vectors, k, lambda_mult)
+    else:
+        hits = hits[:k]
+    return fit_token_budget(merge_overlapping(hits), budget)
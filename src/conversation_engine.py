@@ -1,39 +1,74 @@
 import os
-import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
 import streamlit as st
-from datetime import datetime
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_core.tools import tool
 from langchain.agents import create_openai_tools_agent, AgentExecutor
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from src.global_settings import CONVERSATION_FILE, SCORES_FILE, INDEX_STORAGE
+from src.global_settings import (
+    DEFAULT_USER_ID,
+    CONVERSATION_FILE,
+    RETRIEVAL_PREFETCH,
+    PREFETCH_CONTEXT_MIN_WORDS,
+    PREFETCH_WORKERS,
+)
 from src.prompts import CUSTOM_AGENT_SYSTEM_TEMPLATE
-import chromadb
+from src.embedding_cache import get_embeddings
+from src.conversation_store import JSONLChatMessageHistory
+from src.score_store import get_score_store
+from src.resources import get_resource, get_chat_llm, warm_collection
+from src.retrieval import get_retriever
+from src.sources import get_source
+from src.tracing import span, start_span, use_span, record_cache, TracingCallbackHandler
+from src.prefetch import RetrievalPrefetch
 
 
-def load_chat_store():
-    if os.path.exists(CONVERSATION_FILE) and os.path.getsize(CONVERSATION_FILE) > 0:
-        try:
-            with open(CONVERSATION_FILE, "r") as f:
-                data = json.load(f)
-            chat_store = ChatMessageHistory()
-            for msg in data.get("messages", []):
-                if msg["role"] == "user":
-                    chat_store.add_user_message(msg["content"])
-                elif msg["role"] == "assistant":
-                    chat_store.add_ai_message(msg["content"])
-        except json.JSONDecodeError:
-            chat_store = ChatMessageHistory()
-    else:
-        chat_store = ChatMessageHistory()
+def get_user_id():
+    """
+    Return the id under which the current user's conversation and scores are stored.
+
+    There is no login yet, so the app has a single user. A per-tab id must not be
+    used here, or a returning user would lose their conversation and check-ins.
+    """
+    return DEFAULT_USER_ID
+
+
+def load_chat_store(user_id):
+    """
+    Open the append-only history of a user's conversation, tail-loading the recent
+    messages. The history of the former single chat_history.json is imported once.
+    """
+    chat_store = JSONLChatMessageHistory(user_id)
+    if os.path.exists(CONVERSATION_FILE):
+        chat_store.migrate_json(CONVERSATION_FILE)
     return chat_store
 
 
+# Người dùng của lượt hội thoại hiện tại, dùng để phân vùng điểm số
+current_user_id = ContextVar("current_user_id", default=DEFAULT_USER_ID)
+# Truy xuất DSM-5 được chạy trước cho lượt hiện tại (nếu bật RETRIEVAL_PREFETCH)
+current_prefetch = ContextVar("current_prefetch", default=None)
+
+
+@contextmanager
+def _turn_context(user_id: str, prefetch: Optional[RetrievalPrefetch]):
+    """Set the user and prefetch of the turn for the block, then restore the previous ones."""
+    user_token = current_user_id.set(user_id)
+    prefetch_token = current_prefetch.set(prefetch)
+    try:
+        yield
+    finally:
+        current_prefetch.reset(prefetch_token)
+        current_user_id.reset(user_token)
+
+
 @tool
 def save_score(score: int, level: str, content: str, total_guess: str) -> None:
     """
-    Save the user's mental health score and level to a file.
+    Save the user's mental health score and level to the score store.
 
     Args:
         score (int): Numeric score representing the user's mental health.
@@ -41,49 +76,34 @@ def save_score(score: int, level: str, content: str, total_guess: str) -> None:
         content (str): Content describing the user's mental health.
         total_guess (str): Total guess of the user's mental health.
     """
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    new_entry = {
-        "Time": current_time,
-        "Score": score,
-        "Level": level,
-        "Content": content,
-        "Total guess": total_guess
-    }
-
-    # Initialize data as an empty list
-    data = []
-    try:
-        with open(SCORES_FILE, "r") as f:
-            data = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        # If file doesn't exist or is invalid, keep data as an empty list
-        pass
+    get_score_store().add(current_user_id.get(), score, level, content, total_guess)
 
-    data.append(new_entry)
-    with open(SCORES_FILE, "w") as f:
-        json.dump(data, f, indent=4)
 
+@tool
+def dsm5_query(query: str, sources: Optional[List[str]] = None) -> str:
+    """
+    Cung cấp thông tin liên quan đến các bệnh tâm thần theo tiêu chuẩn DSM-5 và các tài liệu tham khảo khác.
 
-def initialize_chatbot(chat_store):
-    client = chromadb.PersistentClient(path=INDEX_STORAGE)
-
-    collection = client.get_collection(name="vector")
-
-    @tool
-    def dsm5_query(query: str) -> str:
-        """Cung cấp thông tin liên quan đến các bệnh tâm thần theo tiêu chuẩn DSM-5."""
-        results = collection.query(
-            query_texts=[query],
-            n_results=5,
-            query_embeddings=OpenAIEmbeddings().embed_query(query),
-        )
-
-        print(f"Query: {query}, Results: {results}")
+    Args:
+        query (str): What to look up.
+        sources (list[str], optional): Only search these sources, e.g. ["dsm5"] for the DSM-5
+            criteria. Leave empty to search every source.
+    """
+    # The prefetch searches every source, so it only serves unrestricted queries
+    prefetch = current_prefetch.get() if not sources else None
+    passages = prefetch.take(query) if prefetch is not None else None
+    if prefetch is not None:
+        record_cache("prefetch", passages is not None)
+    if passages is None:
+        try:
+            passages = get_retriever().search_context(query, sources=sources or None)
+        except ValueError as e:
+            # Let the agent retry with a valid source
+            return str(e)
+    return "\n\n".join(passages)
 
-        # Extract documents from the nested list
-        documents = results['documents'][0] if results['documents'] else []
-        return "\n".join(documents)
 
+def _build_agent_executor():
     # Danh sách các tools
     tools = [dsm5_query, save_score]
 
@@ -95,43 +115,177 @@ def initialize_chatbot(chat_store):
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
 
-    # Khởi tạo LLM
-    llm = ChatOpenAI(model="gpt-4o", temperature=0.2)
+    # Khởi tạo agent; LLM dùng chung cho cả tiến trình
+    agent = create_openai_tools_agent(get_chat_llm(), tools, prompt)
+    return AgentExecutor(agent=agent, tools=tools)
 
-    # Khởi tạo agent
-    agent = create_openai_tools_agent(llm, tools, prompt)
-    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
 
+def initialize_chatbot(chat_store):
+    """
+    Return the process-wide agent executor together with the session's chat store.
+
+    The agent is stateless between turns (history is passed in on every call), so
+    every session shares one executor, LLM client and Chroma collection; only the
+    chat memory is per session.
+    """
+    agent_executor = get_resource("agent_executor", _build_agent_executor)
     return agent_executor, chat_store
 
 
-def save_chat_store(chat_store):
-    messages = []
-    for msg in chat_store.messages:
-        if isinstance(msg, dict):
-            role = "user" if msg.get("type") == "human" else "assistant"
-            content = msg.get("content")
-        else:
-            role = "user" if msg.type == "human" else "assistant"
-            content = msg.content
-        messages.append({"role": role, "content": content})
-    with open(CONVERSATION_FILE, "w") as f:
-        json.dump({"messages": messages}, f, indent=4)
-
-
-def run_chatbot(agent_executor, chat_store, user_input):
-    response = agent_executor.invoke({
-        "input": user_input,
-        "chat_history": chat_store.messages
-    })
-    # Thêm tin nhắn vào lịch sử
+def warm_up():
+    """Load shared resources at app start so the first session does not pay for it."""
+    get_resource("agent_executor", _build_agent_executor)
+    get_embeddings()
+    get_score_store()
+    for name in get_retriever().sources:
+        warm_collection(get_source(name).collection_name)
+
+
+def _chat_history(chat_store, memory):
+    if memory is None:
+        return chat_store.messages
+    return memory.history(chat_store.messages)
+
+
+def _session_id(chat_store):
+    return getattr(chat_store, "session_id", None)
+
+
+def _start_prefetch(chat_store, user_input, prefetch):
+    """
+    Start retrieval for the user message while the agent's first LLM call runs.
+    Short messages ("có", "thường xuyên") carry little meaning on their own, so the
+    previous user message is prepended to them.
+    """
+    if not (RETRIEVAL_PREFETCH if prefetch is None else prefetch):
+        return None
+    query = user_input
+    if len(user_input.split()) < PREFETCH_CONTEXT_MIN_WORDS:
+        previous = next((m.content for m in reversed(chat_store.messages) if m.type == "human"), None)
+        if previous:
+            query = f"{previous} {user_input}"
+    pool = get_resource("prefetch_pool", lambda: ThreadPoolExecutor(max_workers=PREFETCH_WORKERS))
+    return RetrievalPrefetch(query, get_retriever().search_context, pool)
+
+
+def _finish_prefetch(turn, retrieval_prefetch):
+    # Drop an unused prefetch as soon as the agent is done with the turn
+    if retrieval_prefetch is not None:
+        retrieval_prefetch.cancel()
+        turn.set(prefetch_used=retrieval_prefetch.used)
+
+
+def _save_turn(chat_store, memory, user_input, output):
+    # Thêm tin nhắn vào lịch sử (mỗi tin nhắn được ghi nối tiếp vào file của phiên)
     chat_store.add_user_message(user_input)
-    chat_store.add_ai_message(response["output"])
-    # Lưu lịch sử
-    save_chat_store(chat_store)
+    chat_store.add_ai_message(output)
+    if memory is not None:
+        memory.update(chat_store.messages)
+
+
+def run_chatbot(agent_executor, chat_store, user_input, memory=None, prefetch=None,
+                user_id=DEFAULT_USER_ID):
+    """
+    Run one chatbot turn and save it to the history. Scores saved during the
+    turn go to user_id.
+
+    With prefetch (default RETRIEVAL_PREFETCH), DSM-5 retrieval for the message
+    starts concurrently with the agent's first LLM call, and dsm5_query is served
+    from it when the tool query matches.
+    """
+    with span("turn", session_id=_session_id(chat_store), streaming=False) as turn:
+        retrieval_prefetch = _start_prefetch(chat_store, user_input, prefetch)
+        try:
+            with _turn_context(user_id, retrieval_prefetch):
+                response = agent_executor.invoke(
+                    {"input": user_input, "chat_history": _chat_history(chat_store, memory)},
+                    config={"callbacks": [TracingCallbackHandler(turn)]},
+                )
+        finally:
+            _finish_prefetch(turn, retrieval_prefetch)
+        _save_turn(chat_store, memory, user_input, response["output"])
     return response["output"]
 
 
+async def astream_chatbot(agent_executor, chat_store, user_input, memory=None, prefetch=None,
+                          user_id=DEFAULT_USER_ID):
+    """
+    Stream one chatbot turn from the agent's async event stream.
+
+    Yields (kind, payload) tuples:
+        ("token", text)       a piece of the assistant reply as it is generated
+        ("tool_start", name)  the agent started calling a tool
+        ("tool_end", name)    the tool call finished
+        ("done", output)      the final reply, after it has been saved
+
+    prefetch and user_id work as in run_chatbot.
+    """
+    # The turn span is ended explicitly: a context manager cannot stay open across
+    # yields, since every step of the generator may run in a different context.
+    # For the same reason the span, user and prefetch are set for each step only.
+    turn = start_span("turn", session_id=_session_id(chat_store), streaming=True)
+    output = ""
+    first_token = None
+    retrieval_prefetch = None
+    try:
+        with use_span(turn):
+            retrieval_prefetch = _start_prefetch(chat_store, user_input, prefetch)
+        with use_span(turn), _turn_context(user_id, retrieval_prefetch):
+            events = agent_executor.astream_events(
+                {"input": user_input, "chat_history": _chat_history(chat_store, memory)},
+                config={"callbacks": [TracingCallbackHandler(turn)]},
+                version="v2",
+            )
+        while True:
+            with use_span(turn), _turn_context(user_id, retrieval_prefetch):
+                try:
+                    event = await events.__anext__()
+                except StopAsyncIteration:
+                    break
+            kind = event["event"]
+            if kind == "on_chat_model_stream":
+                content = event["data"]["chunk"].content
+                if content:
+                    if first_token is None:
+                        first_token = turn.elapsed()
+                    yield "token", content
+            elif kind == "on_tool_start":
+                yield "tool_start", event["name"]
+            elif kind == "on_tool_end":
+                yield "tool_end", event["name"]
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                # The root run is the AgentExecutor itself
+                output = event["data"]["output"]["output"]
+        _finish_prefetch(turn, retrieval_prefetch)
+
+        with use_span(turn):
+            # The append (and a periodic compaction) fsyncs; keep it off the event loop
+            await asyncio.to_thread(_save_turn, chat_store, memory, user_input, output)
+    except BaseException as e:
+        _finish_prefetch(turn, retrieval_prefetch)
+        turn.end(error=e)
+        raise
+    turn.set(time_to_first_token_ms=first_token * 1000 if first_token is not None else None).end()
+    yield "done", output
+
+
+def stream_chatbot(agent_executor, chat_store, user_input, memory=None, prefetch=None,
+                   user_id=DEFAULT_USER_ID):
+    """Synchronous wrapper around astream_chatbot for Streamlit script runs."""
+    loop = asyncio.new_event_loop()
+    events = astream_chatbot(agent_executor, chat_store, user_input, memory, prefetch, user_id)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(events.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(events.aclose())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
 def display_messages(chat_store, container):
     with container:
         for msg in chat_store.messages:
@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import List, Sequence
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from src.global_settings import (
+    CONVERSATION_DIR,
+    CONVERSATION_FSYNC,
+    CONVERSATION_FSYNC_INTERVAL,
+    CONVERSATION_TAIL_MESSAGES,
+    CONVERSATION_COMPACT_EVERY,
+    CONVERSATION_KEEP_MESSAGES,
+)
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def is_valid_session_id(session_id: str) -> bool:
+    return bool(session_id) and bool(_SESSION_ID.match(session_id))
+
+
+def _to_record(message: BaseMessage) -> dict:
+    role = "user" if message.type == "human" else "assistant"
+    return {"role": role, "content": message.content, "ts": time.time()}
+
+
+def _to_message(record: dict) -> BaseMessage:
+    if record["role"] == "user":
+        return HumanMessage(content=record["content"])
+    return AIMessage(content=record["content"])
+
+
+def _read_tail_lines(path: str, limit: int, block_size: int = 64 * 1024) -> List[bytes]:
+    """Return the last `limit` lines of a file, reading backwards from the end."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= limit:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+        cut = False
+        if position > 0:
+            f.seek(position - 1)
+            cut = f.read(1) != b"\n"
+    lines = data.split(b"\n")
+    if cut:
+        # The first line starts before the bytes read
+        lines = lines[1:]
+    return [line for line in lines if line.strip()][-limit:]
+
+
+def _ends_without_newline(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+    except FileNotFoundError:
+        return False
+
+
+class JSONLChatMessageHistory(BaseChatMessageHistory):
+    """
+    Per-session chat history stored as an append-only JSONL file.
+
+    Each message is appended as one record, so the write cost of a turn does not
+    depend on the length of the conversation. Only the last `tail` messages are
+    loaded into memory. Every `compact_every` appends the file is compacted: torn
+    lines left by a crash are dropped, and records older than the last `keep` are
+    moved to an append-only archive file next to it, so no history is lost while
+    the live file stays small.
+
+    fsync policy:
+        "always"    fsync after every append
+        "interval"  fsync at most once every fsync_interval seconds
+        "never"     leave flushing to the operating system
+    """
+
+    def __init__(self, session_id: str, root: str = CONVERSATION_DIR,
+                 fsync: str = CONVERSATION_FSYNC,
+                 fsync_interval: float = CONVERSATION_FSYNC_INTERVAL,
+                 tail: int = CONVERSATION_TAIL_MESSAGES,
+                 compact_every: int = CONVERSATION_COMPACT_EVERY,
+                 keep: int = CONVERSATION_KEEP_MESSAGES):
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        if fsync not in ("always", "interval", "never"):
+            raise ValueError(f"Unknown fsync policy: {fsync!r}")
+        os.makedirs(root, exist_ok=True)
+        self.session_id = session_id
+        self.path = os.path.join(root, f"{session_id}.jsonl")
+        self.archive_path = os.path.join(root, f"{session_id}.archive.jsonl")
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._appends = 0
+        self._last_fsync = 0.0
+        # A crash can leave a torn last line; the next record must not be glued to it
+        self._torn_end = _ends_without_newline(self.path)
+        self.messages = self.tail(tail)
+
+    def tail(self, limit: int) -> List[BaseMessage]:
+        """Load the last `limit` messages without reading the whole file."""
+        if limit <= 0 or not os.path.exists(self.path):
+            return []
+        messages = []
+        for line in _read_tail_lines(self.path, limit):
+            try:
+                messages.append(_to_message(json.loads(line)))
+            except (json.JSONDecodeError, KeyError):
+                # Skip a torn or malformed record
+                continue
+        return messages
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        payload = "".join(
+            json.dumps(_to_record(message), ensure_ascii=False) + "\n" for message in messages
+        ).encode("utf-8")
+        with span("history_write", messages=len(messages), bytes=len(payload)), self._lock:
+            if self._torn_end:
+                payload = b"\n" + payload
+                self._torn_end = False
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, payload)
+                now = time.monotonic()
+                if self.fsync == "always" or (
+                    self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval
+                ):
+                    os.fsync(fd)
+                    self._last_fsync = now
+            finally:
+                os.close(fd)
+            self.messages.extend(messages)
+            self._appends += len(messages)
+            if self._appends >= self.compact_every:
+                self._appends = 0
+                self._compact()
+
+    def migrate_json(self, json_path: str) -> int:
+        """
+        Append the messages of a legacy chat_history.json ({"messages": [{"role",
+        "content"}]}), then rename it to *.migrated so the import only happens once.
+
+        Returns:
+            Number of imported messages.
+        """
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        messages = [
+            _to_message(record) for record in data.get("messages", [])
+            if record.get("role") in ("user", "assistant")
+        ]
+        if messages:
+            self.add_messages(messages)
+        try:
+            os.replace(json_path, json_path + ".migrated")
+        except FileNotFoundError:
+            pass
+        logger.info("Migrated %d messages from %s", len(messages), json_path)
+        return len(messages)
+
+    def compact(self) -> None:
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        lines = []
+        with open(self.path, "rb") as f:
+            for line in f:
+                line = line.rstrip(b"\n")
+                try:
+                    json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn or malformed record
+                    continue
+                lines.append(line)
+        split = max(len(lines) - self.keep, 0)
+        archived, lines = lines[:split], lines[split:]
+        if archived:
+            # Archive first: a crash before the rewrite below can duplicate
+            # archived records, but never lose them
+            with open(self.archive_path, "ab") as f:
+                f.write(b"".join(line + b"\n" for line in archived))
+                f.flush()
+                os.fsync(f.fileno())
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(line + b"\n" for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in (self.path, self.archive_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.messages = []
+            self._appends = 0
@@ -0,0 +1,218 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+from langchain_core.embeddings import Embeddings
+
+from src.global_settings import (
+    EMBEDDING_MODEL,
+    EMBEDDING_CACHE_FILE,
+    EMBEDDING_CACHE_MAX_BYTES,
+    EMBEDDING_CACHE_MEMORY_ITEMS,
+)
+from src.providers import get_embedding_model, cache_model_name
+from src.tracing import record_cache
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text before hashing so trivially different inputs share a key."""
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+
+def cache_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    Two-level embedding cache: an in-memory LRU in front of a SQLite file.
+
+    Vectors are stored as float32 blobs keyed by (model, normalized text hash).
+    When the file grows past max_bytes, the least recently used rows are evicted.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_FILE,
+                 max_bytes: int = EMBEDDING_CACHE_MAX_BYTES,
+                 memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                nbytes INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)"
+        )
+        self._conn.commit()
+        row = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()
+        self._disk_bytes = row[0]
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        results = [None] * len(keys)
+        missing = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                else:
+                    missing.setdefault(key, []).append(i)
+            if not missing:
+                return results
+
+            found = []
+            pending = list(missing)
+            for start in range(0, len(pending), 500):
+                batch = pending[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f", blob).tolist()
+                    self._remember(key, vector)
+                    for i in missing[key]:
+                        results[i] = vector
+                    found.append(key)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return results
+
+    def put_many(self, keys: List[str], vectors: List[List[float]]) -> None:
+        now = time.time()
+        rows = []
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                packed = array("f", vector)
+                self._remember(key, packed.tolist())
+                blob = packed.tobytes()
+                rows.append((key, blob, len(blob), now))
+            existing = set()
+            for start in range(0, len(rows), 500):
+                batch = [row[0] for row in rows[start:start + 500]]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(
+                    key for (key,) in self._conn.execute(
+                        f"SELECT key FROM embeddings WHERE key IN ({placeholders})", batch
+                    )
+                )
+            new_rows = [row for row in rows if row[0] not in existing]
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, nbytes, accessed) VALUES (?, ?, ?, ?)",
+                new_rows,
+            )
+            self._disk_bytes += sum(row[2] for row in new_rows)
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        # Drop least recently used rows until we are back under 90% of the budget
+        target = int(self.max_bytes * 0.9)
+        cursor = self._conn.execute("SELECT key, nbytes FROM embeddings ORDER BY accessed ASC")
+        stale = []
+        for key, nbytes in cursor:
+            if self._disk_bytes <= target:
+                break
+            stale.append((key,))
+            self._disk_bytes -= nbytes
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale)
+        for (key,) in stale:
+            self._memory.pop(key, None)
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain Embeddings wrapper that serves repeated texts from an EmbeddingCache."""
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def _lookup(self, texts: List[str]):
+        keys = [cache_key(self.model, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        # Deduplicate misses so identical chunks are only embedded once
+        misses = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None and key not in misses:
+                misses[key] = text
+        record_cache("embedding", True, len(texts) - sum(vector is None for vector in vectors))
+        record_cache("embedding", False, len(misses))
+        return keys, vectors, misses
+
+    def _fill(self, keys, vectors, misses, embedded):
+        self.cache.put_many(list(misses), embedded)
+        fresh = dict(zip(misses, embedded))
+        return [vector if vector is not None else fresh[key] for key, vector in zip(keys, vectors)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, misses = self._lookup(texts)
+        embedded = self.embeddings.embed_documents(list(misses.values())) if misses else []
+        return self._fill(keys, vectors, misses, embedded)
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, vectors, misses = self._lookup([text])
+        if not misses:
+            return vectors[0]
+        return self._fill(keys, vectors, misses, [self.embeddings.embed_query(text)])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, misses = self._lookup(texts)
+        embedded = await self.embeddings.aembed_documents(list(misses.values())) if misses else []
+        return self._fill(keys, vectors, misses, embedded)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, vectors, misses = self._lookup([text])
+        if not misses:
+            return vectors[0]
+        return self._fill(keys, vectors, misses, [await self.embeddings.aembed_query(text)])[0]
+
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """Return the process-wide cached embeddings instance (see src.providers)."""
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            _embeddings = CachedEmbeddings(
+                get_embedding_model(),
+                model=cache_model_name(EMBEDDING_MODEL),
+                cache=EmbeddingCache(),
+            )
+    return _embeddings
@@ -1,24 +1,29 @@
 import os
+import json
 import pandas as pd
 import nest_asyncio
 import asyncio
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from itertools import islice
 from langchain.prompts import PromptTemplate
 from langchain_core.documents import Document as LangChainDocument
 from langchain.evaluation import load_evaluator, EvaluatorType
-from langchain_core.runnables import RunnableSequence
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from dotenv import load_dotenv
 from src.index_builder import build_indexes
 from src.ingest_pipeline import ingest_documents
+from src.embedding_cache import get_embeddings
+from src.retrieval import get_retriever
+from src.providers import get_chat_model
+from src.global_settings import EVAL_CONCURRENCY, EVAL_CHECKPOINT_FILE, EVAL_QUESTIONS_FILE
 
 # Load environment variables
 load_dotenv()
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+if os.getenv("OPENAI_API_KEY"):
+    os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
 
 def generate_questions(documents):
-    llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.7)
+    llm = get_chat_model("gpt-3.5-turbo", temperature=0.7)
     prompt_template = """
     Given the following document content, generate 5 relevant evaluation questions for a RAG system:
     {content}
@@ -34,7 +39,7 @@ def generate_questions(documents):
     chain = prompt | llm
 
     questions = []
-    for doc in documents[:5]:  # Limit to 5 documents
+    for doc in islice(documents, 5):  # Limit to 5 documents
         result = chain.invoke({"content": doc.page_content})
         q_list = result.content.split("\n")[1:6]
         questions.extend([{"question": q.strip()} for q in q_list if q.strip()])
@@ -43,9 +48,32 @@ def generate_questions(documents):
     return df
 
 
-async def evaluate_async(collection, df):
-    llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
-    embeddings = OpenAIEmbeddings()
+def _load_checkpoint(path):
+    """Per-question results of an interrupted run, keyed by question."""
+    done = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line cut off by the interruption
+                done[result["question"]] = result
+    return done
+
+
+async def evaluate_async(retriever, df, concurrency=EVAL_CONCURRENCY,
+                         checkpoint_file=EVAL_CHECKPOINT_FILE):
+    """
+    Evaluate every question concurrently (at most `concurrency` at a time).
+
+    Chains are built once. For each question the answer is generated first, then
+    the correctness, relevancy and faithfulness judges run in parallel. Each
+    finished question is appended to checkpoint_file, and questions already
+    in it are skipped, so an interrupted run resumes where it stopped.
+    """
+    llm = get_chat_model("gpt-3.5-turbo", temperature=0)
+    embeddings = get_embeddings()
 
     # Load LangChain evaluators
     correctness_evaluator = load_evaluator(
@@ -59,78 +87,85 @@ async def evaluate_async(collection, df):
     )
     relevancy_chain = relevancy_prompt | llm
 
-    results = []
-    for _, row in df.iterrows():
-        query = row["question"]
-        # Query ChromaDB directly
-        query_embedding = embeddings.embed_query(query)
-        chroma_results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=3
-        )
-
-        # Convert Chroma results to LangChain Documents
-        docs = [
-            LangChainDocument(
-                page_content=doc,
-                metadata=meta or {}
-            )
-            for doc, meta in zip(
-                chroma_results["documents"][0],
-                chroma_results["metadatas"][0]
+    # Define prompt for QA
+    qa_prompt = PromptTemplate(
+        input_variables=["context", "question"],
+        template="Use the following context to answer the question:\n{context}\n\nQuestion: {question}\nAnswer:"
+    )
+
+    # Create stuff chain
+    stuff_chain = create_stuff_documents_chain(
+        llm=llm,
+        prompt=qa_prompt,
+        document_variable_name="context"
+    )
+
+    # Faithfulness
+    faithfulness_prompt = PromptTemplate(
+        input_variables=["answer", "context"],
+        template="Is the answer: {answer} faithful to the context: {context}? Output 'Yes' or 'No'."
+    )
+    faithfulness_chain = faithfulness_prompt | llm
+
+    done = _load_checkpoint(checkpoint_file)
+    if done:
+        print(f"Resuming evaluation: {len(done)} questions already evaluated")
+    os.makedirs(os.path.dirname(checkpoint_file) or ".", exist_ok=True)
+    semaphore = asyncio.Semaphore(concurrency)
+    checkpoint_lock = asyncio.Lock()
+
+    async def evaluate_question(query):
+        if query in done:
+            return done[query]
+
+        async with semaphore:
+            # Query the vector indexes of all sources directly
+            query_embedding = await embeddings.aembed_query(query)
+            hits = await asyncio.to_thread(retriever.vector_query, query_embedding, 3)
+
+            # Convert hits to LangChain Documents
+            docs = [
+                LangChainDocument(
+                    page_content=hit["text"],
+                    metadata=hit["metadata"]
+                )
+                for hit in hits
+            ]
+            context = " ".join([doc.page_content for doc in docs])
+
+            # Run QA with documents
+            answer = await stuff_chain.ainvoke({
+                "context": docs,
+                "question": query
+            })
+
+            # Run the three judges in parallel
+            correctness_result, relevancy_result, faithfulness_result = await asyncio.gather(
+                correctness_evaluator.ainvoke({
+                    "input": query,
+                    "output": answer  # Changed from 'prediction' to 'output'
+                }),
+                relevancy_chain.ainvoke({"query": query, "context": context}),
+                faithfulness_chain.ainvoke({"answer": answer, "context": context}),
             )
-        ]
-        context = " ".join([doc.page_content for doc in docs])
-
-        # Define prompt for QA
-        qa_prompt = PromptTemplate(
-            input_variables=["context", "question"],
-            template="Use the following context to answer the question:\n{context}\n\nQuestion: {question}\nAnswer:"
-        )
-
-        # Create stuff chain
-        stuff_chain = create_stuff_documents_chain(
-            llm=llm,
-            prompt=qa_prompt,
-            document_variable_name="context"
-        )
-
-        # Run QA with documents
-        response = stuff_chain.invoke({
-            "context": docs,
-            "question": query
-        })
-        answer = response
-
-        # Evaluate correctness using CriteriaEvalChain
-        correctness_result = correctness_evaluator.invoke({
-            "input": query,
-            "output": answer  # Changed from 'prediction' to 'output'
-        })
-        correctness_score = 1 if correctness_result.get("score", 0) >= 0.5 else 0  # Binary score based on correctness
 
-        # Evaluate relevancy
-        relevancy_result = relevancy_chain.invoke({"query": query, "context": context})
+        correctness_score = 1 if correctness_result.get("score", 0) >= 0.5 else 0  # Binary score based on correctness
         relevancy_score = 1 if "Yes" in relevancy_result.content else 0
-
-        # Faithfulness
-        faithfulness_prompt = PromptTemplate(
-            input_variables=["answer", "context"],
-            template="Is the answer: {answer} faithful to the context: {context}? Output 'Yes' or 'No'."
-        )
-        faithfulness_chain = faithfulness_prompt | llm
-        faithfulness_result = faithfulness_chain.invoke({"answer": answer, "context": context})
         faithfulness_score = 1 if "Yes" in faithfulness_result.content else 0
 
-        results.append({
+        result = {
             "question": query,
             "answer": answer,
             "correctness": correctness_score,
             "faithfulness": faithfulness_score,
             "relevancy": relevancy_score
-        })
+        }
+        async with checkpoint_lock:
+            with open(checkpoint_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        return result
 
-    return results
+    return list(await asyncio.gather(*(evaluate_question(query) for query in df["question"])))
 
 
 def aggregate_results(df, eval_results):
@@ -153,28 +188,35 @@ def evaluate():
     nest_asyncio.apply()
 
     # Create document and split into nodes
-    documents = ingest_documents()
+    documents = (doc for store in ingest_documents().values() for doc in store)
 
     # Create vector store index
-    collection = build_indexes()
+    build_indexes()
+    retriever = get_retriever()
 
-    # Generate evaluation questions
-    df = generate_questions(documents)
+    # Generate evaluation questions, reusing those of an interrupted run
+    os.makedirs("eval_results", exist_ok=True)
+    if os.path.exists(EVAL_CHECKPOINT_FILE) and os.path.exists(EVAL_QUESTIONS_FILE):
+        df = pd.read_csv(EVAL_QUESTIONS_FILE)
+    else:
+        df = generate_questions(documents)
+        df.to_csv(EVAL_QUESTIONS_FILE, index=False)
 
     # Evaluate and aggregate results
-    eval_result = asyncio.run(evaluate_async(collection=collection, df=df))
+    eval_result = asyncio.run(evaluate_async(retriever=retriever, df=df))
     df_result = aggregate_results(df, eval_result)
 
     # Print average scores
     correctness_scores, faithfulness_scores, relevancy_scores = print_average_scores(df_result)
 
     # Save results
-    os.makedirs("eval_results", exist_ok=True)
     df_result.to_csv("eval_results/evaluation_results.csv", index=False)
-    df.to_csv("eval_results/evaluation_questions.csv", index=False)
     with open("eval_results/average_scores.txt", "w") as f:
         f.write(f"Correctness scores: {correctness_scores}\n")
         f.write(f"Faithfulness scores: {faithfulness_scores}\n")
         f.write(f"Relevancy scores: {relevancy_scores}\n")
 
+    # The run completed, so the next one starts from fresh questions
+    os.remove(EVAL_CHECKPOINT_FILE)
+
     return df_result
@@ -2,17 +2,105 @@ import os
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-CACHE_FILE = "data/cache/pipeline_cache.json"
-CONVERSATION_FILE = "data/cache/chat_history.json"
+CONVERSATION_DIR = "data/cache/conversations"
+CONVERSATION_FILE = "data/cache/chat_history.json"  # Legacy single history, imported once
 STORAGE_PATH = "data/ingestion_storage/"
-FILES_PATH = [
-    os.path.join(
-        PROJECT_ROOT,
-        "data",
-        "ingestion_storage",
-        "dsm-5-cac-tieu-chuan-chan-doan.pdf"
-    )
-]
+# Corpus sources: each one is ingested into its own chunk store and indexed into
+# its own shard (Chroma collection, BM25 and NumPy indexes), see src.sources
+SOURCES = {
+    "dsm5": [
+        os.path.join(
+            PROJECT_ROOT,
+            "data",
+            "ingestion_storage",
+            "dsm-5-cac-tieu-chuan-chan-doan.pdf"
+        )
+    ],
+}
 INDEX_STORAGE = "data/index_storage"
-SCORES_FILE = "data/user_storage/scores.json"
+# Per-source paths; {source} is the source name
+CHUNK_STORE_DIR = "data/cache/chunk_store/{source}"
+VECTOR_COLLECTION = "vector-{source}"
+LEXICAL_INDEX_FILE = "data/index_storage/{source}/lexical_index.json"
+NUMPY_INDEX_DIR = "data/index_storage/{source}/numpy"
+INDEX_VERSION_FILE = "data/index_storage/{source}/index_version"
+SCORES_FILE = "data/user_storage/scores.json"  # Legacy, migrated into SCORES_DB
+SCORES_DB = "data/user_storage/scores.sqlite3"
+DEFAULT_USER_ID = "default"
 USERS_FILE = "data/user_storage/users.yaml"
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_DIMENSION = 1536
+EMBEDDING_CACHE_FILE = "data/cache/embedding_cache.sqlite3"
+EMBEDDING_CACHE_MAX_BYTES = 256 * 1024 * 1024
+EMBEDDING_CACHE_MEMORY_ITEMS = 4096
+
+INGEST_CONCURRENCY = 8
+EMBED_BATCH_SIZE = 256
+INGEST_MAX_RETRIES = 5
+PARSE_WORKERS = min(8, os.cpu_count() or 1)
+PARSE_PAGES_PER_TASK = 16
+PARSE_PARALLEL_MIN_PAGES = 64
+
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 20  # Only used when a single line has to be split
+TOKEN_COUNT_CACHE_FILE = "data/cache/token_counts.json"
+
+MEMORY_MAX_TURNS = 10
+MEMORY_TOKEN_BUDGET = 3000
+MEMORY_SUMMARY_MODEL = "gpt-4o-mini"
+MEMORY_SUMMARY_WORKERS = 2  # Shared by all sessions; one pending summary per session
+
+CONVERSATION_FSYNC = "interval"  # "always", "interval" or "never"
+CONVERSATION_FSYNC_INTERVAL = 1.0
+CONVERSATION_TAIL_MESSAGES = 200
+CONVERSATION_COMPACT_EVERY = 100
+CONVERSATION_KEEP_MESSAGES = 1000  # Records kept in the live file; older ones are archived
+
+CHAT_MODEL = "gpt-4o"
+
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+SESSION_IDLE_TTL = 1800.0
+SESSION_MAX_ACTIVE = 10000
+SESSION_SWEEP_INTERVAL = 60.0
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") != "0"
+TRACE_FILE = "data/traces/spans.jsonl"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+# "live", "record", "replay" (recorded responses only) or "offline" (local fakes)
+PROVIDER_MODE = os.getenv("PROVIDER_MODE", "live")
+PROVIDER_CACHE_FILE = "data/cache/provider_cache.sqlite3"
+
+RETRIEVAL_MODE = "hybrid"  # "hybrid", "vector" or "lexical"
+RETRIEVAL_EMBED_TIMEOUT = 2.0
+RETRIEVAL_EMBED_COOLDOWN = 30.0
+RRF_K = 60
+
+VECTOR_BACKEND = "chroma"  # "chroma" or "numpy"
+NUMPY_INDEX_DTYPE = "float32"  # "float32", "float16" or "int8"
+
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_TTL = 3600.0
+SEMANTIC_CACHE_MAX_ENTRIES = 1024
+
+# Shards are queried concurrently, so retrieval latency stays flat as sources are added
+SHARD_QUERY_WORKERS = 8
+
+RETRIEVAL_TOP_K = 5
+RETRIEVAL_FETCH_K = 20
+MMR_LAMBDA = 0.7
+CONTEXT_TOKEN_BUDGET = 1500
+
+# Start dsm5_query retrieval for the user message concurrently with the first LLM call
+RETRIEVAL_PREFETCH = False
+PREFETCH_MATCH_THRESHOLD = 0.5
+PREFETCH_CONTEXT_MIN_WORDS = 4
+PREFETCH_WORKERS = 8
+
+EVAL_CONCURRENCY = 8
+EVAL_CHECKPOINT_FILE = "eval_results/checkpoint.jsonl"
+EVAL_QUESTIONS_FILE = "eval_results/evaluation_questions.csv"
@@ -1,16 +1,69 @@
 import os
+import json
+import hashlib
+import logging
+from typing import Dict, Iterable, Optional
 import chromadb
-from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
-import pickle
 
-from src.global_settings import INDEX_STORAGE, CACHE_FILE
+from src.global_settings import INDEX_STORAGE, EMBEDDING_MODEL
+from src.chunk_store import ChunkStore
+from src.lexical_index import BM25Index
+from src.vector_backend import write_numpy_index
+from src.embedding_cache import get_embeddings
+from src.providers import cache_model_name
+from src.sources import Source, select_sources
+from src.tracing import span
 
+logger = logging.getLogger(__name__)
 
-def build_indexes():
+
+def chunk_id(source: str, page, text: str) -> str:
+    """Stable, content-addressed id for a chunk: hash of source, page and text."""
+    digest = hashlib.sha256(f"{source}\x00{page}\x00{text}".encode("utf-8")).hexdigest()
+    return digest[:32]
+
+
+def _simplify_metadata(metadata: dict) -> dict:
+    metadata = metadata.copy()
+    # Remove or simplify complex fields
+    metadata.pop('embedding', None)  # Vectors never belong in metadata
+    metadata.pop('summary', None)  # Summaries stay in the chunk store's sections table
+    # Ensure all metadata values are simple types
+    return {
+        k: v for k, v in metadata.items()
+        if isinstance(v, (str, int, float, bool)) or v is None
+    }
+
+
+def _fingerprint(metadata: dict) -> str:
+    payload = json.dumps([cache_model_name(EMBEDDING_MODEL), metadata], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def build_indexes(sync: bool = True, sources: Optional[Iterable[str]] = None) -> Dict[str, object]:
     """
-    Build or load vector index using LangChain and ChromaDB from cached JSON data.
-    Automatically persists the index to INDEX_STORAGE.
+    Build or update the shard of every source (or of the named sources only).
+
+    Returns:
+        Chroma collection of each source, by source name
+    """
+    return {source.name: build_source_index(source, sync) for source in select_sources(sources)}
+
+
+def build_source_index(source: Source, sync: bool = True):
+    """
+    Build or load the shard of one source from its chunk store: a ChromaDB
+    collection persisted to INDEX_STORAGE, plus its BM25 and NumPy indexes and
+    index version file. Other sources' shards are not touched.
+
+    Chunk ids are derived from source, page and content, so the collection can be
+    synchronised with the chunk store incrementally: only new or changed chunks are
+    upserted and chunks no longer in the cache are deleted.
+
+    Args:
+        source (Source): The source to index.
+        sync (bool): Diff the chunk store against the collection and apply the changes.
+            If False, the collection is only populated when it is empty.
 
     Returns:
         Chroma vectorstore object
@@ -18,74 +71,117 @@ def build_indexes():
     # Create INDEX_STORAGE directory if it doesn't exist
     os.makedirs(INDEX_STORAGE, exist_ok=True)
 
-    # Check if cache file exists
-    if not os.path.exists(CACHE_FILE):
-        raise FileNotFoundError(f"Cache file not found at {CACHE_FILE}")
-
-    # Read data from cache file
-    with open(CACHE_FILE, "rb") as f:
-        try:
-            cached_data = pickle.load(f)
-            print("Cache file found. Running using cache...")
-        except Exception as e:
-            raise ValueError(f"Error reading cache file: {e}")
-
-    # Convert cached data to list of Documents
-    if isinstance(cached_data[0], Document):
-        documents = cached_data
-    else:
-        documents = [
-            Document(
-                page_content=doc["page_content"],
-                metadata=doc.get("metadata", {})
-            )
-            for doc in cached_data
-        ]
+    # Check if the chunk store exists
+    store = ChunkStore(source.chunk_store_dir)
+    manifest = store.manifest
+    if manifest is None:
+        raise FileNotFoundError(f"Chunk store not found at {store.path}")
+    logger.info("Chunk store of %s found. Running using cache...", source.name)
 
-    # Initialize embeddings
-    embeddings = OpenAIEmbeddings()
+    # Vectors computed with another model cannot be mixed into this collection
+    reuse_vectors = manifest.get("params", {}).get("embedding_model") == cache_model_name(EMBEDDING_MODEL)
 
     # Initialize Chroma client
     client = chromadb.PersistentClient(path=INDEX_STORAGE)
 
     # Get or create collection
     collection = client.get_or_create_collection(
-        name="vector",
+        name=source.collection_name,
         embedding_function=None,  # LangChain will handle embeddings
         metadata={"hnsw:space": "cosine"}
     )
 
-    # Check if collection is empty before adding documents
-    if collection.count() == 0:
-        # Generate embeddings for documents
-        document_embeddings = embeddings.embed_documents(
-            [doc.page_content for doc in documents]
-        )
-
-        # Prepare simplified metadata
-        simplified_metadatas = []
-        for doc in documents:
-            metadata = doc.metadata.copy()
-            # Remove or simplify complex fields
-            if 'input_documents' in metadata:
-                del metadata['input_documents']  # Remove problematic field
-            # Ensure all metadata values are simple types
-            simplified_metadata = {
-                k: v for k, v in metadata.items()
-                if isinstance(v, (str, int, float, bool)) or v is None
-            }
-            simplified_metadatas.append(simplified_metadata)
-
-        # Add documents to collection
-        collection.add(
-            ids=[str(i) for i in range(len(documents))],
-            documents=[doc.page_content for doc in documents],
-            embeddings=document_embeddings,
-            metadatas=simplified_metadatas
-        )
-        print(f"Added {len(documents)} documents to vector store")
-    else:
-        print("Using existing vector store")
-
-    print(f"Number of documents in vector store: {collection.count()}")
+    if not sync and collection.count() > 0:
+        logger.info("Using existing vector store with %d documents", collection.count())
+        return collection
+
+    # Desired state of the collection, keyed by content-addressed id (streamed from disk)
+    desired = {}
+    occurrences = {}
+    for doc, vector in store.iter_records():
+        if not reuse_vectors:
+            vector = None
+        base_id = chunk_id(doc.metadata.get("id"), doc.metadata.get("page"), doc.page_content)
+        # Identical text repeated on the same page still needs distinct ids
+        occurrences[base_id] = occurrences.get(base_id, 0) + 1
+        doc_id = base_id if occurrences[base_id] == 1 else f"{base_id}-{occurrences[base_id]}"
+        metadata = _simplify_metadata(doc.metadata)
+        metadata["fingerprint"] = _fingerprint(metadata)
+        desired[doc_id] = (doc, vector, metadata)
+
+    # Current state of the collection
+    existing = collection.get(include=["metadatas"])
+    current = {
+        doc_id: (metadata or {}).get("fingerprint")
+        for doc_id, metadata in zip(existing["ids"], existing["metadatas"])
+    }
+
+    stale_ids = [doc_id for doc_id in current if doc_id not in desired]
+    upsert_ids = [
+        doc_id for doc_id, (_, _, metadata) in desired.items()
+        if current.get(doc_id) != metadata["fingerprint"]
+    ]
+
+    if upsert_ids:
+        # Reuse ingestion-time embeddings; only embed chunks that lack a vector
+        upserted_vectors = {doc_id: desired[doc_id][1] for doc_id in upsert_ids}
+        missing = [doc_id for doc_id, vector in upserted_vectors.items() if vector is None]
+        if missing:
+            with span("embedding", texts=len(missing)):
+                computed = get_embeddings().embed_documents(
+                    [desired[doc_id][0].page_content for doc_id in missing]
+                )
+            upserted_vectors.update(zip(missing, computed))
+        logger.info("Reused %d cached embeddings, computed %d", len(upsert_ids) - len(missing), len(missing))
+
+        with span("vector_upsert", documents=len(upsert_ids)):
+            collection.upsert(
+                ids=upsert_ids,
+                documents=[desired[doc_id][0].page_content for doc_id in upsert_ids],
+                embeddings=[list(map(float, upserted_vectors[doc_id])) for doc_id in upsert_ids],
+                metadatas=[desired[doc_id][2] for doc_id in upsert_ids]
+            )
+    if stale_ids:
+        with span("vector_delete", documents=len(stale_ids)):
+            collection.delete(ids=stale_ids)
+
+    logger.info("Upserted %d and deleted %d documents in vector store", len(upsert_ids), len(stale_ids))
+
+    # Rebuild the BM25 index over the same chunks; it is local and takes well under a second
+    ids = list(desired)
+    with span("file_write", path=source.lexical_index_file, documents=len(ids)):
+        BM25Index().build(
+            ids,
+            [desired[doc_id][0].page_content for doc_id in ids],
+            [desired[doc_id][2] for doc_id in ids],
+        ).save(source.lexical_index_file)
+    logger.info("Lexical index saved to %s", source.lexical_index_file)
+
+    # Export the embedding matrix for the in-process NumPy backend
+    vectors = {doc_id: vector for doc_id, (_, vector, _) in desired.items() if vector is not None}
+    if upsert_ids:
+        vectors.update({doc_id: upserted_vectors[doc_id] for doc_id in upsert_ids})
+    missing = [doc_id for doc_id in ids if doc_id not in vectors]
+    if missing:
+        stored = collection.get(ids=missing, include=["embeddings"])
+        vectors.update(zip(stored["ids"], stored["embeddings"]))
+    if ids:
+        with span("file_write", path=source.numpy_index_dir, documents=len(ids)):
+            write_numpy_index(
+                ids,
+                [vectors[doc_id] for doc_id in ids],
+                [desired[doc_id][0].page_content for doc_id in ids],
+                [desired[doc_id][2] for doc_id in ids],
+                path=source.numpy_index_dir,
+            )
+        logger.info("NumPy index saved to %s", source.numpy_index_dir)
+    # Record the index version; retrieval caches are dropped when it changes
+    version = hashlib.sha256(
+        "".join(f"{doc_id}:{desired[doc_id][2]['fingerprint']}\n" for doc_id in sorted(desired)).encode("utf-8")
+    ).hexdigest()
+    os.makedirs(os.path.dirname(source.index_version_file), exist_ok=True)
+    with open(source.index_version_file, "w", encoding="utf-8") as f:
+        f.write(version)
+
+    logger.info("Number of documents in vector store of %s: %d", source.name, collection.count())
     return collection
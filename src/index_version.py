@@ -0,0 +1,48 @@
+import os
+import threading
+from typing import Optional
+
+
+def read_index_version(path: str) -> Optional[str]:
+    """Version string written by build_indexes, or None if the index has none yet."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _stat(path: str):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class IndexVersionWatcher:
+    """
+    Tells when build_indexes records a new version of an index. A check is one
+    stat call; the version file is only read when its stat changed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stat = _stat(path)
+        self.version = read_index_version(path)
+
+    def changed(self) -> bool:
+        """True once for every new version since the last call (or since creation)."""
+        stat = _stat(self.path)
+        if stat == self._stat:
+            return False
+        with self._lock:
+            if stat == self._stat:
+                return False
+            self._stat = stat
+            version = read_index_version(self.path)
+            if version == self.version:
+                return False
+            self.version = version
+            return True
@@ -1,104 +1,230 @@
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import TokenTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain.chains.summarize.chain import load_summarize_chain
 from langchain.docstore.document import Document
-from langchain_openai import ChatOpenAI
 import os
-import pickle
-from typing import List
+import random
+import logging
+import hashlib
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
 from dotenv import load_dotenv
-from src.global_settings import FILES_PATH, CACHE_FILE
+from src.global_settings import (
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    EMBEDDING_MODEL,
+    INGEST_CONCURRENCY,
+    EMBED_BATCH_SIZE,
+    INGEST_MAX_RETRIES,
+)
 from src.prompts import CUSTOM_SUMMARY_EXTRACT_TEMPLATE
+from src.embedding_cache import get_embeddings
+from src.chunk_store import ChunkStore
+from src.pdf_loader import iter_pages
+from src.chunker import iter_sections, CHUNKER_VERSION
+from src.providers import get_chat_model, cache_model_name
+from src.sources import Source, select_sources
+from src.tracing import span
 
 load_dotenv()
 
-# Set OpenAI API key from environment variable
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-
-
-def ingest_documents() -> List[Document]:
-    # Load documents
-    documents = []
-    for file_path in FILES_PATH:
-        if not os.path.exists(file_path):
-            print(f"File not found: {file_path}")
-            continue
-
-        if file_path.endswith(".pdf"):  # Assuming PDF files, adjust as needed
-            loader = PyPDFLoader(file_path)
-            docs = loader.load()
-            # Set document ID as filename
-            for doc in docs:
-                doc.metadata["id"] = os.path.basename(file_path)
-                documents.append(doc)
-        else:
-            # For text files or other formats
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-                doc = Document(
-                    page_content=content,
-                    metadata={"id": os.path.basename(file_path)}
-                )
-                documents.append(doc)
-
-    for doc in documents:
-        print(doc.metadata["id"])
+# Set OpenAI API key from environment variable (not needed with offline providers)
+if os.getenv("OPENAI_API_KEY"):
+    os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
-    # Check for cache
-    try:
-        with open(CACHE_FILE, "rb") as f:
-            cached_data = pickle.load(f)
-            print("Cache file found. Running using cache...")
-            return cached_data
-    except FileNotFoundError:
-        print("No cache file found. Running without cache...")
+SUMMARY_MODEL = "gpt-4o"
 
-    # Initialize components
-    llm = ChatOpenAI(
-        model="gpt-4o",
-        temperature=0.2,
-        max_tokens=512
-    )
-    text_splitter = TokenTextSplitter(
-        chunk_size=512,
-        chunk_overlap=20
+logger = logging.getLogger(__name__)
+
+
+def _file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pipeline_manifest(source: Source) -> dict:
+    """
+    Describe the inputs of the ingestion pipeline for one source: its file hashes
+    and the parameters that shape the chunks. A chunk store whose manifest differs
+    is stale; changing one source's files leaves the other sources current.
+    """
+    sources = {
+        os.path.basename(file_path): _file_hash(file_path)
+        for file_path in source.files
+        if os.path.exists(file_path)
+    }
+    params = {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "chunker": CHUNKER_VERSION,
+        "summary_model": cache_model_name(SUMMARY_MODEL),
+        "summary_prompt": hashlib.sha256(
+            CUSTOM_SUMMARY_EXTRACT_TEMPLATE.template.encode("utf-8")
+        ).hexdigest(),
+        "embedding_model": cache_model_name(EMBEDDING_MODEL),
+    }
+    return {"sources": sources, "params": params}
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors and connection problems are worth retrying."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status == 429 or 500 <= status < 600
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError)) or \
+        type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+async def with_backoff(call: Callable[[], Awaitable], retries: int = INGEST_MAX_RETRIES,
+                       base_delay: float = 1.0, max_delay: float = 30.0):
+    """Await call(), retrying retryable errors with exponential backoff and full jitter."""
+    for attempt in range(retries + 1):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == retries or not _is_retryable(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            await asyncio.sleep(random.uniform(0, delay))
+
+
+async def aprocess_documents(
+    documents: Iterable[Document],
+    llm,
+    embeddings,
+    concurrency: int = INGEST_CONCURRENCY,
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> Tuple[List[dict], List[Document], List[List[float]]]:
+    """
+    Chunk, summarize and embed pages concurrently.
+
+    documents may be a lazy iterator of pages (see src.pdf_loader.iter_pages). It
+    is consumed off the event loop and grouped into DSM-5 sections by
+    src.chunker; each section is chunked and its summary and embedding batches
+    are started as soon as the section is complete, so parsing overlaps with the
+    API calls. Section summaries and embedding batches all run under a shared
+    semaphore, so total time is bounded by the slowest requests rather than their
+    sum. Any LangChain chat model and Embeddings implementation can be passed in,
+    which allows running the pipeline against local fakes.
+
+    Returns:
+        (section rows, chunk documents, chunk embeddings) in document order. Each
+        summary is stored once in its section row; chunks refer to it by the
+        section_id in their metadata.
+    """
+    summary_chain = load_summarize_chain(
+        llm,
+        chain_type="stuff",
+        prompt=CUSTOM_SUMMARY_EXTRACT_TEMPLATE
     )
-    embeddings = OpenAIEmbeddings()
+    semaphore = asyncio.Semaphore(concurrency)
 
-    # Process documents
-    processed_docs = []
+    async def summarize(chunks: List[Document]):
+        inputs = {"input_documents": chunks}
+        async with semaphore:
+            return await with_backoff(lambda: summary_chain.ainvoke(inputs))
 
-    for doc in documents:
-        # Split document into chunks
-        chunks = text_splitter.split_text(doc.page_content)
+    async def embed(batch: List[str]):
+        async with semaphore:
+            return await with_backoff(lambda: embeddings.aembed_documents(batch))
 
-        # Summarize each document
-        summary_chain = load_summarize_chain(
-            llm,
-            chain_type="stuff",
-            prompt=CUSTOM_SUMMARY_EXTRACT_TEMPLATE
-        )
-        summary = summary_chain.invoke(
-            {"input_documents": [Document(page_content=chunk, metadata=doc.metadata) for chunk in chunks]}
+    sections = iter_sections(documents)
+    section_list = []
+    section_chunks: List[List[Document]] = []
+    summary_tasks = []
+    embed_tasks = []
+    pending: List[str] = []
+    try:
+        while True:
+            # Parsing blocks, so pull the next section from a worker thread
+            section = await asyncio.to_thread(next, sections, None)
+            if section is None:
+                break
+            chunks = section.chunks()
+            section_list.append(section)
+            section_chunks.append(chunks)
+            summary_tasks.append(asyncio.create_task(summarize(chunks)))
+            pending.extend(chunk.page_content for chunk in chunks)
+            while len(pending) >= batch_size:
+                embed_tasks.append(asyncio.create_task(embed(pending[:batch_size])))
+                pending = pending[batch_size:]
+        if pending:
+            embed_tasks.append(asyncio.create_task(embed(pending)))
+
+        summaries = await asyncio.gather(*summary_tasks)
+        embedded_batches = await asyncio.gather(*embed_tasks)
+    except BaseException:
+        for task in summary_tasks + embed_tasks:
+            task.cancel()
+        raise
+
+    # Summaries go in the section rows and vectors alongside the chunks, not in metadata
+    section_rows = [section.row(summary["output_text"]) for section, summary in zip(section_list, summaries)]
+    processed_docs = [chunk for chunks in section_chunks for chunk in chunks]
+    chunk_embeddings = [vector for batch in embedded_batches for vector in batch]
+
+    return section_rows, processed_docs, chunk_embeddings
+
+
+def ingest_documents(llm=None, embeddings=None, sources: Optional[Iterable[str]] = None) -> Dict[str, ChunkStore]:
+    """
+    Run the ingestion pipeline of every source (or of the named sources only).
+
+    Returns:
+        ChunkStore of each source, by source name
+    """
+    return {
+        source.name: ingest_source(source, llm, embeddings)
+        for source in select_sources(sources)
+    }
+
+
+def ingest_source(source: Source, llm=None, embeddings=None) -> ChunkStore:
+    """
+    Run the ingestion pipeline for one source, or reuse its chunk store if it is
+    still current.
+
+    Returns:
+        ChunkStore; iterate it to stream the chunk Documents.
+    """
+    store = ChunkStore(source.chunk_store_dir)
+    manifest = pipeline_manifest(source)
+
+    # Check for cache
+    if store.is_current(manifest):
+        logger.info("Chunk store of %s is up to date. Running using cache...", source.name)
+        return store
+    logger.info("Chunk store of %s missing or stale. Running without cache...", source.name)
+
+    # Pages are parsed lazily (in parallel for large PDFs) while they are processed
+    pages = iter_pages(source.files)
+
+    # Initialize components
+    if llm is None:
+        llm = get_chat_model(
+            SUMMARY_MODEL,
+            temperature=0.2,
+            max_tokens=512
         )
+    if embeddings is None:
+        embeddings = get_embeddings()
 
-        # Create new Document objects for each chunk with summary in metadata
-        for chunk in chunks:
-            embedded_chunk = embeddings.embed_query(chunk)
-            chunk_doc = Document(
-                page_content=chunk,
-                metadata={
-                    "id": doc.metadata["id"],
-                    "summary": summary,
-                    "embedding": embedded_chunk
-                }
-            )
-            processed_docs.append(chunk_doc)
+    with span("ingest", source=source.name, files=len(source.files)) as ingest_span:
+        section_rows, processed_docs, chunk_embeddings = asyncio.run(
+            aprocess_documents(pages, llm, embeddings)
+        )
+        ingest_span.set(sections=len(section_rows), chunks=len(processed_docs))
+    logger.info("Processed %d chunks from %d files of %s", len(processed_docs), len(source.files), source.name)
 
     # Save to cache
-    with open(CACHE_FILE, "wb") as f:
-        pickle.dump(processed_docs, f)
-        print(f"Cache saved to {CACHE_FILE}")
+    with span("file_write", path=store.path, chunks=len(processed_docs)):
+        with store.writer(manifest) as writer:
+            for row in section_rows:
+                writer.add_section(row)
+            writer.extend(processed_docs, chunk_embeddings)
+    logger.info("Chunk store saved to %s", store.path)
 
-    return processed_docs
+    return store
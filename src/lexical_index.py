@@ -0,0 +1,161 @@
+import os
+import re
+import json
+import math
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+# DSM-5 / ICD codes such as "F32.1" or "296.23" are kept as single tokens
+_TOKEN = re.compile(r"[a-z]?\d+(?:\.\d+)+|\w+")
+_CODE = re.compile(r"[a-z]?\d+(?:\.\d+)+|[a-z]\d+")
+
+
+def fold_accents(text: str) -> str:
+    """Strip Vietnamese diacritics ("trầm cảm" -> "tram cam")."""
+    text = text.replace("đ", "d").replace("Đ", "D")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Vietnamese-aware tokenization.
+
+    Vietnamese words are usually several syllables, so adjacent syllable pairs are
+    indexed as bigrams ("trầm_cảm") next to the syllables themselves. Accent-folded
+    syllables are added as well, so queries typed without diacritics still match.
+    """
+    syllables = _TOKEN.findall(unicodedata.normalize("NFC", text).lower())
+    tokens = list(syllables)
+    tokens.extend(f"{a}_{b}" for a, b in zip(syllables, syllables[1:]))
+    for syllable in syllables:
+        folded = fold_accents(syllable)
+        if folded != syllable:
+            tokens.append(folded)
+    return tokens
+
+
+def code_tokens(text: str) -> Tuple[str, ...]:
+    """Diagnosis codes mentioned in a text ("F32.1", "296.23", "F43"), normalized and sorted."""
+    tokens = _TOKEN.findall(unicodedata.normalize("NFC", text).lower())
+    return tuple(sorted({token for token in tokens if _CODE.fullmatch(token)}))
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over the chunked corpus, kept entirely in memory."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.idf: Dict[str, float] = {}
+        self.avg_length = 0.0
+        self._norms: Optional[np.ndarray] = None
+        self._weights: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def build(self, ids: List[str], texts: List[str], metadatas: Optional[List[dict]] = None) -> "BM25Index":
+        self.ids = list(ids)
+        self.texts = list(texts)
+        self.metadatas = list(metadatas) if metadatas is not None else [{} for _ in ids]
+        postings = defaultdict(list)
+        self.doc_lengths = []
+        for i, text in enumerate(self.texts):
+            counts = Counter(tokenize(text))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((i, tf))
+        self.postings = dict(postings)
+        self._finalize()
+        return self
+
+    def _finalize(self) -> None:
+        n = len(self.ids)
+        self.avg_length = sum(self.doc_lengths) / n if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+        lengths = np.asarray(self.doc_lengths, dtype=np.float32)
+        self._norms = self.k1 * (1 - self.b + self.b * lengths / (self.avg_length or 1.0))
+        self._weights = {}
+
+    def _term_weights(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        # The BM25 weight of each posting does not depend on the query, so it is
+        # computed on first use of the term; a search is then one vector addition
+        # per query term
+        weights = self._weights.get(term)
+        if weights is None:
+            docs = self.postings.get(term)
+            if not docs:
+                return None
+            postings = np.asarray(docs, dtype=np.int64).reshape(-1, 2)
+            rows, tfs = postings[:, 0], postings[:, 1].astype(np.float32)
+            values = self.idf[term] * tfs * (self.k1 + 1) / (tfs + self._norms[rows])
+            weights = self._weights[term] = (rows, values.astype(np.float32))
+        return weights
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Return up to k (id, score) pairs, best first."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        matched = False
+        for term in set(tokenize(query)):
+            posting = self._term_weights(term)
+            if posting is None:
+                continue
+            rows, weights = posting
+            # Each document appears at most once in a term's postings
+            scores[rows] += weights
+            matched = True
+        if not matched:
+            return []
+        candidates = np.flatnonzero(scores)
+        k = min(k, len(candidates))
+        if k <= 0:
+            return []
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    def document(self, doc_id: str) -> Optional[Tuple[str, dict]]:
+        if not hasattr(self, "_positions"):
+            self._positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        i = self._positions.get(doc_id)
+        if i is None:
+            return None
+        return self.texts[i], self.metadatas[i]
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        payload = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "texts": self.texts,
+            "metadatas": self.metadatas,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        index = cls(k1=payload["k1"], b=payload["b"])
+        index.ids = payload["ids"]
+        index.texts = payload["texts"]
+        index.metadatas = payload["metadatas"]
+        index.doc_lengths = payload["doc_lengths"]
+        index.postings = {term: [tuple(p) for p in docs] for term, docs in payload["postings"].items()}
+        index._finalize()
+        return index
@@ -0,0 +1,128 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from langchain_core.messages import BaseMessage, SystemMessage
+
+from src.global_settings import (
+    MEMORY_MAX_TURNS,
+    MEMORY_TOKEN_BUDGET,
+    MEMORY_SUMMARY_MODEL,
+    MEMORY_SUMMARY_WORKERS,
+)
+from src.prompts import CUSTOM_MEMORY_SUMMARY_TEMPLATE
+from src.providers import get_chat_model
+from src.resources import get_resource
+from src.tracing import span, TracingCallbackHandler
+from src.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+def _message_tokens(message: BaseMessage) -> int:
+    # A few tokens of per-message overhead for role and separators
+    return count_tokens(message.content) + 4
+
+
+def get_summary_llm():
+    """Shared summary model, so sessions reuse one client and its connection pool."""
+    return get_resource("summary_llm", lambda: get_chat_model(MEMORY_SUMMARY_MODEL, temperature=0))
+
+
+def get_summary_pool() -> ThreadPoolExecutor:
+    """Background threads that run summary updates for every session in the process."""
+    return get_resource(
+        "summary_pool",
+        lambda: ThreadPoolExecutor(max_workers=MEMORY_SUMMARY_WORKERS, thread_name_prefix="memory-summary"),
+    )
+
+
+def _format_lines(messages: List[BaseMessage]) -> str:
+    lines = []
+    for message in messages:
+        role = "User" if message.type == "human" else "Assistant"
+        lines.append(f"{role}: {message.content}")
+    return "\n".join(lines)
+
+
+class ConversationMemory:
+    """
+    Token-budgeted view of a conversation for the agent prompt.
+
+    The most recent turns (at most max_turns, within token_budget) are passed
+    verbatim; older messages are folded into a rolling summary. The summary is
+    updated on the shared summary pool after each turn, so it never delays a reply.
+    """
+
+    def __init__(self, max_turns: int = MEMORY_MAX_TURNS,
+                 token_budget: int = MEMORY_TOKEN_BUDGET, llm=None):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.llm = llm or get_summary_llm()
+        self.summary = ""
+        # Number of leading messages already folded into the summary
+        self.summarized_count = 0
+        self._lock = threading.Lock()
+        self._pending = None
+
+    def _window_start(self, messages: List[BaseMessage]) -> int:
+        budget = self.token_budget - (count_tokens(self.summary) if self.summary else 0)
+        lower = max(self.summarized_count, len(messages) - 2 * self.max_turns)
+        start = len(messages)
+        used = 0
+        while start > lower:
+            cost = _message_tokens(messages[start - 1])
+            if used + cost > budget:
+                break
+            used += cost
+            start -= 1
+        return start
+
+    def history(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """Messages to pass as chat_history: the summary followed by the recent window."""
+        with self._lock:
+            start = self._window_start(messages)
+            summary = self.summary
+        history = list(messages[start:])
+        if summary:
+            history.insert(0, SystemMessage(content=f"Tóm tắt cuộc trò chuyện trước đó:\n{summary}"))
+        return history
+
+    def update(self, messages: List[BaseMessage]) -> None:
+        """Schedule folding messages that fell out of the window into the summary."""
+        with self._lock:
+            if self._pending is not None and not self._pending.done():
+                return
+            start = self._window_start(messages)
+            if start <= self.summarized_count:
+                return
+            old_messages = list(messages[self.summarized_count:start])
+            self._pending = get_summary_pool().submit(self._summarize, old_messages, start)
+
+    def _summarize(self, old_messages: List[BaseMessage], end: int) -> None:
+        try:
+            with span("memory_summary", messages=len(old_messages)) as summary_span:
+                result = self.llm.invoke(
+                    CUSTOM_MEMORY_SUMMARY_TEMPLATE.format(
+                        summary=self.summary or "(chưa có)",
+                        new_lines=_format_lines(old_messages),
+                    ),
+                    config={"callbacks": [TracingCallbackHandler(summary_span)]},
+                )
+        except Exception as e:
+            logger.warning("Memory summarization failed: %s", e)
+            return
+        with self._lock:
+            self.summary = result.content.strip()
+            self.summarized_count = end
+
+    def wait(self) -> None:
+        """Block until any pending summary update has finished."""
+        pending = self._pending
+        if pending is not None:
+            pending.result()
+
+    def close(self) -> None:
+        """Drop a summary update that has not started yet; one already running completes."""
+        pending = self._pending
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,90 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
+from langchain.docstore.document import Document
+
+from src.global_settings import PARSE_WORKERS, PARSE_PAGES_PER_TASK, PARSE_PARALLEL_MIN_PAGES
+
+logger = logging.getLogger(__name__)
+
+
+def _page_count(file_path: str) -> int:
+    import pypdf
+    return len(pypdf.PdfReader(file_path).pages)
+
+
+def _extract_pages(file_path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Text of pages [start, stop) of a PDF; runs in a worker process."""
+    import pypdf
+    reader = pypdf.PdfReader(file_path)
+    return [(number, reader.pages[number].extract_text().strip()) for number in range(start, stop)]
+
+
+def _page_document(file_path: str, number: int, text: str) -> Document:
+    # Same metadata as PyPDFLoader, plus the file name as the document id
+    return Document(
+        page_content=text,
+        metadata={"source": file_path, "page": number, "id": os.path.basename(file_path)},
+    )
+
+
+def _iter_pdf_serial(file_path: str) -> Iterator[Document]:
+    import pypdf
+    reader = pypdf.PdfReader(file_path)
+    for number, page in enumerate(reader.pages):
+        yield _page_document(file_path, number, page.extract_text().strip())
+
+
+def _iter_pdf_parallel(file_path: str, page_count: int, pool: ProcessPoolExecutor,
+                       pages_per_task: int) -> Iterator[Document]:
+    futures = [
+        pool.submit(_extract_pages, file_path, start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    ]
+    try:
+        # Page ranges are extracted concurrently but yielded in order, each as soon
+        # as it and every range before it are done
+        for future in futures:
+            for number, text in future.result():
+                yield _page_document(file_path, number, text)
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def iter_pages(file_paths: Iterable[str], workers: int = PARSE_WORKERS,
+               pages_per_task: int = PARSE_PAGES_PER_TASK,
+               parallel_min_pages: int = PARSE_PARALLEL_MIN_PAGES) -> Iterator[Document]:
+    """
+    Lazily yield one Document per PDF page (or per non-PDF file), in order.
+
+    PDFs with at least parallel_min_pages pages are split into ranges of
+    pages_per_task pages that are extracted on a pool of worker processes, so
+    parsing a large document scales with cores; smaller ones are parsed in this
+    process. Pages are yielded as soon as they are ready, so downstream work can
+    start before the whole file is parsed.
+    """
+    pool = None
+    try:
+        for file_path in file_paths:
+            if not os.path.exists(file_path):
+                logger.warning("File not found: %s", file_path)
+                continue
+
+            if not file_path.endswith(".pdf"):
+                # For text files or other formats
+                with open(file_path, "r", encoding="utf-8") as f:
+                    yield Document(page_content=f.read(), metadata={"id": os.path.basename(file_path)})
+                continue
+
+            page_count = _page_count(file_path)
+            if workers > 1 and page_count >= parallel_min_pages:
+                if pool is None:
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                yield from _iter_pdf_parallel(file_path, page_count, pool, pages_per_task)
+            else:
+                yield from _iter_pdf_serial(file_path)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,61 @@
+import logging
+from contextvars import copy_context
+from concurrent.futures import Executor, CancelledError
+from typing import Callable, List, Optional
+
+from src.global_settings import PREFETCH_MATCH_THRESHOLD
+from src.lexical_index import tokenize, fold_accents
+
+logger = logging.getLogger(__name__)
+
+
+def _terms(text: str) -> set:
+    # Accent-folded syllables; bigrams are left out so a reordered query still matches
+    return {fold_accents(token) for token in tokenize(text) if "_" not in token}
+
+
+def query_overlap(a: str, b: str) -> float:
+    """Overlap coefficient of the two queries' terms: |A & B| / min(|A|, |B|)."""
+    terms_a, terms_b = _terms(a), _terms(b)
+    if not terms_a or not terms_b:
+        return 0.0
+    return len(terms_a & terms_b) / min(len(terms_a), len(terms_b))
+
+
+class RetrievalPrefetch:
+    """
+    DSM-5 retrieval started speculatively for a turn, before the agent has decided
+    to call dsm5_query.
+
+    The search runs on executor while the first LLM call is in flight. When the
+    tool is called with a query close enough to the prefetched one, take() serves
+    the prefetched passages; otherwise the tool searches as usual. cancel() drops
+    an unused prefetch at the end of the turn (a search that already started runs
+    to completion in its thread, but its result is discarded).
+    """
+
+    def __init__(self, query: str, search: Callable[[str], List[str]], executor: Executor,
+                 threshold: float = PREFETCH_MATCH_THRESHOLD):
+        self.query = query
+        self.threshold = threshold
+        self.used = False
+        # Run in a copy of the caller's context so the search is traced under the turn
+        self._future = executor.submit(copy_context().run, search, query)
+
+    def take(self, query: str) -> Optional[List[str]]:
+        """Prefetched passages if query matches the prefetched query, else None."""
+        if self._future.cancelled() or query_overlap(self.query, query) < self.threshold:
+            return None
+        try:
+            passages = self._future.result()
+        except CancelledError:
+            return None
+        except Exception as e:
+            logger.warning("Prefetched retrieval failed: %s", e)
+            return None
+        self.used = True
+        return passages
+
+    def cancel(self) -> None:
+        if not self.used:
+            self._future.cancel()
@@ -43,3 +43,19 @@ Trong cuộc trò chuyện này, bạn cần thực hiện các bước sau:
 - Ưu tiên sự thoải mái của người dùng, đảm bảo cuộc trò chuyện tự nhiên và không gây áp lực. Emoji nên được dùng để tăng sự thân thiện, nhưng phải phù hợp với cảm xúc của người dùng (ví dụ: dùng 🥺 khi họ buồn, 🌟 khi khích lệ).
 """
 )
+
+CUSTOM_MEMORY_SUMMARY_TEMPLATE = PromptTemplate(
+    input_variables=["summary", "new_lines"],
+    template="""\
+Progressively summarize the conversation between a user and a mental health support assistant, adding onto the previous summary and returning a new summary.
+Keep the user's feelings, important events, symptoms they mentioned and any assessment already given. Write the summary in Vietnamese.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:
+"""
+)
@@ -0,0 +1,345 @@
+"""
+Provider layer for chat models and embeddings.
+
+PROVIDER_MODE selects how model calls are served:
+    "live"     call OpenAI directly
+    "record"   call OpenAI and record every response in PROVIDER_CACHE_FILE,
+               serving repeated calls from the recording
+    "replay"   serve calls only from the recording; a call that was never
+               recorded raises ReplayMissError (for deterministic regression
+               and performance runs)
+    "offline"  deterministic local fakes, no network access at all
+"""
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Iterator, AsyncIterator, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    ToolMessage,
+    messages_from_dict,
+    messages_to_dict,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from src.global_settings import (
+    PROVIDER_MODE,
+    PROVIDER_CACHE_FILE,
+    EMBEDDING_MODEL,
+    EMBEDDING_DIMENSION,
+)
+
+
+class ReplayMissError(KeyError):
+    """A call was made in replay mode that is not in the recording."""
+
+
+def _key(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _message_key(message: BaseMessage) -> Dict[str, Any]:
+    """
+    The parts of a message that determine a model's reply.
+
+    Run-specific fields (message ids such as "run-<uuid>", response and usage
+    metadata) differ between a recording and its replay, so they are left out.
+    """
+    record = {
+        # A streamed AIMessageChunk in the history stands for the same AI turn
+        "type": "ai" if isinstance(message, AIMessage) else message.type,
+        "content": message.content,
+    }
+    if isinstance(message, AIMessage) and message.tool_calls:
+        record["tool_calls"] = [
+            {"name": call["name"], "args": call["args"], "id": call.get("id")}
+            for call in message.tool_calls
+        ]
+    if isinstance(message, ToolMessage):
+        record["tool_call_id"] = message.tool_call_id
+    return record
+
+
+class RecordReplayStore:
+    """Persistent key/value store of recorded model responses (SQLite)."""
+
+    def __init__(self, path: str = PROVIDER_CACHE_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value) VALUES (?, ?)",
+                (key, json.dumps(value, ensure_ascii=False)),
+            )
+
+
+class RecordReplayChatModel(BaseChatModel):
+    """
+    Chat model wrapper that records responses keyed by (model, parameters,
+    messages, call options such as bound tools) and replays them.
+    """
+
+    inner: Optional[BaseChatModel] = None
+    store: Any = None
+    model_name: str
+    params: Dict[str, Any] = {}
+    replay_only: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "record-replay"
+
+    def _call_key(self, messages: List[BaseMessage], stop, kwargs) -> str:
+        return _key("chat", self.model_name, self.params, [_message_key(m) for m in messages], stop, kwargs)
+
+    def _replay(self, key: str) -> Optional[ChatResult]:
+        recorded = self.store.get(key)
+        if recorded is None:
+            if self.replay_only:
+                raise ReplayMissError(f"No recorded response for chat call {key}")
+            return None
+        return ChatResult(generations=[
+            ChatGeneration(message=message) for message in messages_from_dict(recorded)
+        ])
+
+    def _record(self, key: str, result: ChatResult) -> ChatResult:
+        self.store.put(key, messages_to_dict([generation.message for generation in result.generations]))
+        return result
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = self._call_key(messages, stop, kwargs)
+        result = self._replay(key)
+        if result is not None:
+            return result
+        return self._record(key, self.inner._generate(messages, stop=stop, **kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = self._call_key(messages, stop, kwargs)
+        result = self._replay(key)
+        if result is not None:
+            return result
+        return self._record(key, await self.inner._agenerate(messages, stop=stop, **kwargs))
+
+
+class RecordReplayEmbeddings(Embeddings):
+    """Embeddings wrapper that records vectors per (model, text) and replays them."""
+
+    def __init__(self, inner: Optional[Embeddings], store: RecordReplayStore, model: str,
+                 replay_only: bool = False):
+        self.inner = inner
+        self.store = store
+        self.model = model
+        self.replay_only = replay_only
+
+    def _split(self, texts: List[str]):
+        keys = [_key("embedding", self.model, text) for text in texts]
+        vectors = [self.store.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing and self.replay_only:
+            raise ReplayMissError(f"No recorded embedding for {len(missing)} texts")
+        return keys, vectors, missing
+
+    def _merge(self, keys, vectors, missing, computed):
+        for i, vector in zip(missing, computed):
+            self.store.put(keys[i], vector)
+            vectors[i] = vector
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._split(texts)
+        computed = self.inner.embed_documents([texts[i] for i in missing]) if missing else []
+        return self._merge(keys, vectors, missing, computed)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._split(texts)
+        computed = await self.inner.aembed_documents([texts[i] for i in missing]) if missing else []
+        return self._merge(keys, vectors, missing, computed)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic offline chat model.
+
+    The reply is derived from a hash of the conversation, so the same input always
+    gives the same output. If tool_call names a bound tool, the first step of each
+    agent turn calls it with the user's message as "query". latency adds a fixed
+    delay per call, and tokens are streamed word by word.
+    """
+
+    latency: float = 0.0
+    tool_call: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-offline"
+
+    def _reply(self, messages: List[BaseMessage], kwargs) -> AIMessage:
+        last_human = next((m.content for m in reversed(messages) if m.type == "human"), "")
+        tool_names = [tool["function"]["name"] for tool in kwargs.get("tools", [])]
+        if self.tool_call in tool_names and not isinstance(messages[-1], ToolMessage):
+            call_id = "call_" + _key(last_human)[:16]
+            return AIMessage(
+                content="",
+                tool_calls=[{"name": self.tool_call, "args": {"query": last_human}, "id": call_id}],
+            )
+        digest = _key([m.content for m in messages])[:8]
+        return AIMessage(content=f"Mình đã nghe bạn chia sẻ. (offline reply {digest})")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, kwargs))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, kwargs))])
+
+    def _chunks(self, message: AIMessage) -> Iterator[ChatGenerationChunk]:
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                    for i, call in enumerate(message.tool_calls)
+                ],
+            ))
+            return
+        words = message.content.split(" ")
+        for i, word in enumerate(words):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        if self.latency:
+            time.sleep(self.latency)
+        for chunk in self._chunks(self._reply(messages, kwargs)):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in self._chunks(self._reply(messages, kwargs)):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic offline embeddings: a normalized sum of per-word random vectors
+    seeded by the word's hash, so texts sharing words get similar vectors.
+    """
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION, latency: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(word.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dimension)
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension)
+        for word in text.lower().split():
+            vector += self._word_vector(word)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _get_store() -> RecordReplayStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RecordReplayStore()
+    return _store
+
+
+def get_chat_model(model: str, mode: str = PROVIDER_MODE, **params) -> BaseChatModel:
+    """Chat model for the given OpenAI model name and parameters, served according to mode."""
+    if mode == "live":
+        return ChatOpenAI(model=model, **params)
+    if mode == "offline":
+        # Exercise the retrieval tool on every agent turn, as the real model mostly does
+        return FakeChatModel(tool_call="dsm5_query")
+    if mode in ("record", "replay"):
+        inner = ChatOpenAI(model=model, **params) if mode == "record" else None
+        return RecordReplayChatModel(
+            inner=inner,
+            store=_get_store(),
+            model_name=model,
+            params=params,
+            replay_only=mode == "replay",
+        )
+    raise ValueError(f"Unknown provider mode: {mode!r}")
+
+
+def cache_model_name(model: str, mode: str = PROVIDER_MODE) -> str:
+    """
+    Model name used in cache keys and manifests, so outputs of the offline fakes
+    are never mistaken for (or reused as) real model outputs.
+    """
+    return f"offline:{model}" if mode == "offline" else model
+
+
+def get_embedding_model(mode: str = PROVIDER_MODE) -> Embeddings:
+    """Embeddings for EMBEDDING_MODEL, served according to mode."""
+    if mode == "live":
+        return OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    if mode == "offline":
+        return FakeEmbeddings()
+    if mode in ("record", "replay"):
+        inner = OpenAIEmbeddings(model=EMBEDDING_MODEL) if mode == "record" else None
+        return RecordReplayEmbeddings(inner, _get_store(), EMBEDDING_MODEL, replay_only=mode == "replay")
+    raise ValueError(f"Unknown provider mode: {mode!r}")
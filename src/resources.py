@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict
+import chromadb
+
+from src.global_settings import INDEX_STORAGE, CHAT_MODEL
+from src.providers import get_chat_model
+
+_resources: Dict[str, Any] = {}
+_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def get_resource(name: str, factory: Callable[[], Any]) -> Any:
+    """
+    Return the process-wide resource registered under name, creating it with
+    factory on first use. Creation happens at most once even under concurrent
+    sessions; other callers wait for it.
+    """
+    resource = _resources.get(name)
+    if resource is not None:
+        return resource
+    with _registry_lock:
+        lock = _locks.setdefault(name, threading.Lock())
+    with lock:
+        if name not in _resources:
+            _resources[name] = factory()
+        return _resources[name]
+
+
+def drop_resource(name: str) -> None:
+    """Forget one shared resource so the next get_resource call recreates it."""
+    with _registry_lock:
+        _resources.pop(name, None)
+
+
+def clear_resources() -> None:
+    """
+    Drop every shared resource so the next use recreates it (cold-start benchmarks).
+    Thread pools among them are shut down.
+    """
+    with _registry_lock:
+        dropped = list(_resources.values())
+        _resources.clear()
+    for resource in dropped:
+        if isinstance(resource, Executor):
+            resource.shutdown(wait=False)
+
+
+def get_chroma_client():
+    return get_resource("chroma_client", lambda: chromadb.PersistentClient(path=INDEX_STORAGE))
+
+
+def get_collection(name: str):
+    """Shared handle to a Chroma collection; used read-only by the chat sessions."""
+    return get_resource(f"collection:{name}", lambda: get_chroma_client().get_collection(name=name))
+
+
+def get_chat_llm():
+    """Shared chat model; its HTTP connection pool is reused across sessions."""
+    return get_resource("chat_llm", lambda: get_chat_model(CHAT_MODEL, temperature=0.2))
+
+
+def warm_collection(name: str) -> None:
+    """Run one query so Chroma loads the HNSW index into memory before the first user does."""
+    collection = get_collection(name)
+    sample = collection.get(limit=1, include=["embeddings"])
+    if sample["ids"]:
+        collection.query(query_embeddings=[list(sample["embeddings"][0])], n_results=1)
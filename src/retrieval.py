@@ -0,0 +1,311 @@
+import os
+import time
+import logging
+from contextvars import copy_context
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from src.global_settings import (
+    RETRIEVAL_MODE,
+    RETRIEVAL_EMBED_TIMEOUT,
+    RETRIEVAL_EMBED_COOLDOWN,
+    RRF_K,
+    SEMANTIC_CACHE_ENABLED,
+    RETRIEVAL_TOP_K,
+    RETRIEVAL_FETCH_K,
+    MMR_LAMBDA,
+    CONTEXT_TOKEN_BUDGET,
+    SHARD_QUERY_WORKERS,
+)
+from src.lexical_index import BM25Index, code_tokens
+from src.semantic_cache import SemanticCache
+from src.context_builder import build_context
+from src.embedding_cache import get_embeddings
+from src.resources import get_resource
+from src.vector_backend import get_vector_backend
+from src.sources import Source, get_sources
+from src.index_version import IndexVersionWatcher
+from src.tracing import span, start_span, record_cache
+
+logger = logging.getLogger(__name__)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[tuple]:
+    """Fuse several ranked id lists: score(id) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def merge_by_score(hit_lists: Iterable[List[dict]], k: int) -> List[dict]:
+    """Top k of several shards' hit lists by their "score", best first."""
+    hits = [hit for hits in hit_lists for hit in hits]
+    hits.sort(key=lambda hit: hit["score"], reverse=True)
+    return hits[:k]
+
+
+class Shard:
+    """The indexes of one source: its vector backend and, optionally, its BM25 index."""
+
+    def __init__(self, name: str, vector_backend, lexical_index: Optional[BM25Index] = None):
+        self.name = name
+        self._vector_backend = vector_backend
+        self._lexical_index = lexical_index
+
+    @property
+    def vector_backend(self):
+        return self._vector_backend
+
+    @property
+    def lexical_index(self) -> Optional[BM25Index]:
+        return self._lexical_index
+
+
+def _load_lexical_index(source: Source) -> Optional[BM25Index]:
+    if not os.path.exists(source.lexical_index_file):
+        logger.warning("Lexical index not found at %s, using vector retrieval only", source.lexical_index_file)
+        return None
+    return BM25Index.load(source.lexical_index_file)
+
+
+class SourceShard(Shard):
+    """
+    Shard of a configured source. Both indexes follow rebuilds: they are
+    reloaded once build_indexes records a new index version for the source.
+    """
+
+    def __init__(self, source: Source):
+        self.source = source
+        self._version = IndexVersionWatcher(source.index_version_file)
+        super().__init__(source.name, get_vector_backend(source), _load_lexical_index(source))
+
+    @property
+    def vector_backend(self):
+        return get_vector_backend(self.source)
+
+    @property
+    def lexical_index(self) -> Optional[BM25Index]:
+        if self._version.changed():
+            self._lexical_index = _load_lexical_index(self.source)
+        return self._lexical_index
+
+
+class HybridRetriever:
+    """
+    Retrieval over the corpus shards, combining BM25 over the chunk texts with
+    the configured vector backend.
+
+    Every source is a Shard with its own indexes. A query fans out to the
+    selected shards concurrently (one task per shard and search kind) and the
+    per-shard hits are merged by score: cosine similarity for dense hits, BM25
+    for lexical ones. BM25 scores are only roughly comparable between shards,
+    since each uses its own document statistics; in hybrid mode the merged
+    lexical ranking only feeds rank fusion, which evens this out. Hits carry the
+    name of their shard under "source".
+
+    Modes:
+        "hybrid"   both searches, merged with reciprocal-rank fusion
+        "vector"   dense search only
+        "lexical"  BM25 only, answered in-process without any network call
+
+    Lexical search starts together with the query embedding. In hybrid mode the
+    embedding must arrive within embed_timeout seconds; otherwise, or if the
+    embedding service fails, the query is answered from the lexical hits and
+    dense search is skipped for embed_cooldown seconds.
+
+    Results of embedded queries go through an optional SemanticCache, so a query
+    close enough to a recent one is answered without searching.
+    """
+
+    def __init__(self, shards: List[Shard], embeddings,
+                 semantic_cache: Optional[SemanticCache] = None,
+                 mode: str = RETRIEVAL_MODE,
+                 embed_timeout: float = RETRIEVAL_EMBED_TIMEOUT,
+                 embed_cooldown: float = RETRIEVAL_EMBED_COOLDOWN,
+                 workers: int = SHARD_QUERY_WORKERS):
+        if mode not in ("hybrid", "vector", "lexical"):
+            raise ValueError(f"Unknown retrieval mode: {mode!r}")
+        self.shards = {shard.name: shard for shard in shards}
+        self.embeddings = embeddings
+        self.semantic_cache = semantic_cache
+        self.mode = mode
+        self.embed_timeout = embed_timeout
+        self.embed_cooldown = embed_cooldown
+        self._embed_pool = ThreadPoolExecutor(max_workers=4)
+        self._shard_pool = ThreadPoolExecutor(max_workers=workers)
+        self._vector_disabled_until = 0.0
+
+    @property
+    def sources(self) -> List[str]:
+        return list(self.shards)
+
+    def close(self) -> None:
+        """Stop the worker threads; an embedding still running is not waited for."""
+        self._embed_pool.shutdown(wait=False, cancel_futures=True)
+        self._shard_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _select(self, sources: Optional[Iterable[str]]) -> List[Shard]:
+        if sources is None:
+            return list(self.shards.values())
+        names = list(dict.fromkeys(sources))
+        unknown = [name for name in names if name not in self.shards]
+        if unknown or not names:
+            raise ValueError(f"No index for sources {unknown or names} (available: {', '.join(self.shards)})")
+        return [self.shards[name] for name in names]
+
+    def _submit(self, calls: List[Callable[[], List[dict]]]) -> List[Future]:
+        """Start the calls on the shard pool, each traced under the current span."""
+        return [self._shard_pool.submit(copy_context().run, call) for call in calls]
+
+    def _fan_out(self, calls: List[Callable[[], List[dict]]]) -> List[List[dict]]:
+        """Run the calls on the shard pool and wait for all of them."""
+        if len(calls) == 1:
+            return [calls[0]()]
+        return [future.result() for future in self._submit(calls)]
+
+    def _embed(self, query: str, has_lexical: bool):
+        if self.mode == "lexical" or time.monotonic() < self._vector_disabled_until:
+            return None
+        embed_span = start_span("embedding", texts=1)
+        future = self._embed_pool.submit(self.embeddings.embed_query, query)
+        # Without a lexical index there is nothing to fall back to, so wait for the embedding
+        timeout = self.embed_timeout if has_lexical else None
+        try:
+            embedding = future.result(timeout=timeout)
+        except Exception as e:
+            embed_span.end(error=e)
+            if not has_lexical:
+                raise
+            logger.warning("Embedding unavailable (%s), using lexical retrieval", type(e).__name__)
+            self._vector_disabled_until = time.monotonic() + self.embed_cooldown
+            return None
+        embed_span.end()
+        return embedding
+
+    def _vector_search(self, shard: Shard, query_embedding, k: int) -> List[dict]:
+        backend = shard.vector_backend
+        with span("vector_query", k=k, backend=type(backend).__name__, source=shard.name):
+            return [dict(hit, source=shard.name) for hit in backend.query([query_embedding], k)[0]]
+
+    def _lexical_search(self, shard: Shard, query: str, k: int) -> List[dict]:
+        with span("lexical_query", k=k, source=shard.name):
+            hits = []
+            for doc_id, score in shard.lexical_index.search(query, k):
+                text, metadata = shard.lexical_index.document(doc_id)
+                hits.append({"id": doc_id, "text": text, "metadata": metadata, "score": score, "source": shard.name})
+            return hits
+
+    def vector_query(self, query_embedding, k: int = 5, sources: Optional[Iterable[str]] = None) -> List[dict]:
+        """Dense search only, for an already computed query embedding."""
+        shards = self._select(sources)
+        return merge_by_score(self._fan_out([
+            lambda shard=shard: self._vector_search(shard, query_embedding, k) for shard in shards
+        ]), k)
+
+    def search(self, query: str, k: int = 5, sources: Optional[Iterable[str]] = None) -> List[dict]:
+        """Return up to k hits as dicts with id, text, metadata, score and source, best first."""
+        return self._retrieve(query, k, self._select(sources))[0]
+
+    def search_context(self, query: str, k: int = RETRIEVAL_TOP_K,
+                       fetch_k: int = RETRIEVAL_FETCH_K,
+                       lambda_mult: float = MMR_LAMBDA,
+                       budget: int = CONTEXT_TOKEN_BUDGET,
+                       sources: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Return compact context passages for the agent: fetch_k candidates are
+        diversified down to k with MMR on their stored embeddings, overlapping
+        neighbour chunks are merged or dropped, and the result is cut to budget tokens.
+        sources restricts the search to those shards (default: all of them).
+        """
+        shards = self._select(sources)
+        with span("retrieval", mode=self.mode, k=k, fetch_k=fetch_k, shards=len(shards)) as retrieval_span:
+            hits, query_embedding = self._retrieve(query, fetch_k, shards)
+            vectors = {}
+            if query_embedding is not None and hits:
+                vectors = self._hit_embeddings(hits)
+            passages = build_context(query_embedding, hits, vectors, k, lambda_mult, budget)
+            retrieval_span.set(hits=len(hits), passages=len(passages), dense=query_embedding is not None)
+            return passages
+
+    def _hit_embeddings(self, hits: List[dict]) -> Dict:
+        ids_by_shard: Dict[str, List[str]] = {}
+        for hit in hits:
+            ids_by_shard.setdefault(hit["source"], []).append(hit["id"])
+        vectors = {}
+        for shard_vectors in self._fan_out([
+            lambda name=name, ids=ids: self.shards[name].vector_backend.embeddings(ids)
+            for name, ids in ids_by_shard.items()
+        ]):
+            vectors.update(shard_vectors)
+        return vectors
+
+    def _retrieve(self, query: str, k: int, shards: List[Shard]):
+        lexical_shards = [shard for shard in shards if shard.lexical_index is not None]
+        use_lexical = bool(lexical_shards) and self.mode != "vector"
+        # BM25 is in-process, so it runs while the embedding is computed and the
+        # lexical answer is ready as soon as the embedding times out; it over-fetches
+        # so rank fusion has candidates from both sides
+        lexical = self._submit([
+            lambda shard=shard: self._lexical_search(shard, query, k * 2) for shard in lexical_shards
+        ]) if use_lexical else []
+        query_embedding = None if self.mode == "lexical" else self._embed(query, bool(lexical_shards))
+
+        if query_embedding is None:
+            if not use_lexical:
+                return [], None
+            return merge_by_score([future.result() for future in lexical], k), None
+
+        # Queries that differ only in a code (F32.1 vs F33.1) embed almost identically,
+        # so the codes are part of the scope and such queries never share cached hits
+        scope = (tuple(sorted(shard.name for shard in shards)), code_tokens(query))
+        if self.semantic_cache is not None:
+            cached = self.semantic_cache.lookup(query_embedding, k, scope)
+            record_cache("semantic", cached is not None)
+            if cached is not None:
+                return cached, query_embedding
+        hits = self._search_with_embedding(query_embedding, k, shards, lexical)
+        if self.semantic_cache is not None:
+            self.semantic_cache.store(query_embedding, k, hits, scope)
+        return hits, query_embedding
+
+    def _search_with_embedding(self, query_embedding, k: int, shards: List[Shard],
+                               lexical: List[Future]) -> List[dict]:
+        # Dense searches of every shard run at once, next to the lexical ones already started
+        vector_hits = merge_by_score(self._fan_out([
+            lambda shard=shard: self._vector_search(shard, query_embedding, k) for shard in shards
+        ]), k)
+        if not lexical:
+            return vector_hits
+        lexical_hits = merge_by_score([future.result() for future in lexical], k * 2)
+
+        by_id = {hit["id"]: hit for hit in lexical_hits}
+        by_id.update({hit["id"]: hit for hit in vector_hits})
+        fused = reciprocal_rank_fusion([
+            [hit["id"] for hit in vector_hits],
+            [hit["id"] for hit in lexical_hits],
+        ])
+        return [by_id[doc_id] for doc_id, _ in fused[:k]]
+
+
+def _build_retriever() -> HybridRetriever:
+    sources = list(get_sources().values())
+    shards = []
+    for source in sources:
+        try:
+            get_vector_backend(source)
+        except Exception as e:
+            # A source added to SOURCES but not indexed yet must not break the others
+            logger.warning("No vector index for source %s (%s), skipping it", source.name, e)
+            continue
+        shards.append(SourceShard(source))
+    semantic_cache = None
+    if SEMANTIC_CACHE_ENABLED:
+        semantic_cache = SemanticCache(version_files=[source.index_version_file for source in sources])
+    return HybridRetriever(shards, get_embeddings(), semantic_cache)
+
+
+def get_retriever() -> HybridRetriever:
+    """Process-wide retriever shared by all sessions."""
+    return get_resource("retriever", _build_retriever)
@@ -0,0 +1,163 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from src.global_settings import SCORES_DB, SCORES_FILE, DEFAULT_USER_ID
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Latest time of any period, used to complete a partial end bound
+_LATEST_TIME = "9999-12-31 23:59:59"
+
+
+def _row_to_entry(row) -> dict:
+    # Same keys as the entries of the legacy scores.json
+    return {
+        "Time": row[0],
+        "Score": row[1],
+        "Level": row[2],
+        "Content": row[3],
+        "Total guess": row[4],
+    }
+
+
+class ScoreStore:
+    """
+    SQLite-backed store for mental health scores.
+
+    Scores are partitioned by user id and indexed by time, so inserts are single
+    atomic statements and queries never scan other users' history. The database
+    runs in WAL mode so the tracking page can read while a chat session writes.
+    """
+
+    def __init__(self, path: str = SCORES_DB, legacy_json: Optional[str] = SCORES_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS scores (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    score INTEGER NOT NULL,
+                    level TEXT NOT NULL,
+                    content TEXT,
+                    total_guess TEXT
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS scores_user_time ON scores (user_id, time)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS scores_user_level_time ON scores (user_id, level, time)"
+            )
+        if legacy_json and os.path.exists(legacy_json):
+            self.migrate_json(legacy_json)
+
+    def add(self, user_id: str, score: int, level: str, content: str, total_guess: str,
+            time: Optional[str] = None) -> dict:
+        time = time or datetime.now().strftime(TIME_FORMAT)
+        with span("score_write"), self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO scores (user_id, time, score, level, content, total_guess) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, time, score, level, content, total_guess),
+            )
+        return _row_to_entry((time, score, level, content, total_guess))
+
+    def _select(self, where: str, params: tuple, order: str = "time ASC",
+                limit: Optional[int] = None) -> List[dict]:
+        query = (
+            "SELECT time, score, level, content, total_guess FROM scores "
+            f"WHERE {where} ORDER BY {order}"
+        )
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [_row_to_entry(row) for row in rows]
+
+    def range(self, user_id: str, start: Optional[str] = None,
+              end: Optional[str] = None) -> List[dict]:
+        """
+        Scores of a user with start <= Time <= end, oldest first. The bounds are
+        TIME_FORMAT strings or prefixes of them, and a prefix end includes its whole
+        period: end="2024-01-31" includes every score of January 31.
+        """
+        end = end + _LATEST_TIME[len(end):] if end else _LATEST_TIME
+        return self._select(
+            "user_id = ? AND time >= ? AND time <= ?",
+            (user_id, start or "", end),
+        )
+
+    def latest(self, user_id: str, n: int = 1) -> List[dict]:
+        """The n most recent scores of a user, oldest first."""
+        return list(reversed(self._select("user_id = ?", (user_id,), order="time DESC", limit=n)))
+
+    def by_level(self, user_id: str, level: str) -> List[dict]:
+        return self._select("user_id = ? AND level = ?", (user_id, level))
+
+    def version(self, user_id: str) -> tuple:
+        """Cheap (row count, last row id) pair that changes whenever a user's scores change."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM scores WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+
+    def migrate_json(self, json_path: str, user_id: str = DEFAULT_USER_ID) -> int:
+        """
+        Import entries from a legacy scores.json file, then rename it to *.migrated
+        so the import only happens once.
+
+        Returns:
+            Number of imported entries.
+        """
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = []
+
+        rows = [
+            (user_id, entry["Time"], entry["Score"], entry["Level"],
+             entry.get("Content"), entry.get("Total guess"))
+            for entry in data
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO scores (user_id, time, score, level, content, total_guess) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        try:
+            os.replace(json_path, json_path + ".migrated")
+        except FileNotFoundError:
+            pass
+        logger.info("Migrated %d scores from %s", len(rows), json_path)
+        return len(rows)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_score_store() -> ScoreStore:
+    """Return the process-wide score store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ScoreStore()
+    return _store
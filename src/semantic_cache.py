@@ -0,0 +1,132 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+import numpy as np
+
+from src.global_settings import (
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+)
+from src.index_version import read_index_version
+
+
+class SemanticCache:
+    """
+    Cache of retrieval results keyed by query embedding.
+
+    A lookup returns the results of a cached query whose embedding has cosine
+    similarity >= threshold with the new one, so paraphrases of a recent question
+    skip the search. Entries expire after ttl seconds, the least recently used
+    entry is evicted beyond max_entries, and everything is dropped when the index
+    version of any shard in version_files changes.
+
+    Results are only reused for the same scope (the retriever passes the shards
+    searched and the diagnosis codes in the query), so a query restricted to one
+    source is never answered with another source's hits, nor an F33.1 query with
+    F32.1 hits.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl: float = SEMANTIC_CACHE_TTL,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 version_files: Sequence[str] = ()):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_files = list(version_files)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (normalized embedding, k, results, created_at, scope)
+        self._next_key = 0
+        self._matrix = None
+        self._keys: List[int] = []
+        self._version = self._read_version()
+        self._version_stat = self._stat()
+
+    def _read_version(self):
+        return tuple(read_index_version(path) for path in self.version_files)
+
+    def _stat(self):
+        stats = []
+        for path in self.version_files:
+            try:
+                stat = os.stat(path)
+                stats.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stats.append(None)
+        return tuple(stats)
+
+    def _check_version(self) -> None:
+        # A stat per lookup is cheap; the file is only read when it changed
+        stat = self._stat()
+        if stat == self._version_stat:
+            return
+        self._version_stat = stat
+        version = self._read_version()
+        if version != self._version:
+            self._version = version
+            self._clear()
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._matrix = None
+        self._keys = []
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _expire(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if now - entry[3] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def lookup(self, embedding, k: int, scope: tuple = ()) -> Optional[list]:
+        query = np.array(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        with self._lock:
+            self._check_version()
+            self._expire(time.monotonic())
+            if self._entries:
+                if self._matrix is None:
+                    self._keys = list(self._entries)
+                    self._matrix = np.stack([self._entries[key][0] for key in self._keys])
+                similarities = self._matrix @ query
+                for i in np.argsort(-similarities):
+                    if similarities[i] < self.threshold:
+                        break
+                    key = self._keys[i]
+                    _, cached_k, results, _, cached_scope = self._entries[key]
+                    if cached_k >= k and cached_scope == scope:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return results[:k]
+            self.misses += 1
+            return None
+
+    def store(self, embedding, k: int, results: list, scope: tuple = ()) -> None:
+        vector = np.array(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        with self._lock:
+            self._entries[self._next_key] = (vector, k, list(results), time.monotonic(), scope)
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "index_version": self._version,
+            }
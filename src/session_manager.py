@@ -0,0 +1,128 @@
+import time
+import uuid
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from src.global_settings import SESSION_IDLE_TTL, SESSION_MAX_ACTIVE, SESSION_SWEEP_INTERVAL
+from src.conversation_store import JSONLChatMessageHistory, is_valid_session_id
+from src.memory import ConversationMemory
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """One open conversation: its chat history, memory and turn lock."""
+
+    def __init__(self, session_id: str, chat_store: JSONLChatMessageHistory, memory: ConversationMemory):
+        self.session_id = session_id
+        self.chat_store = chat_store
+        self.memory = memory
+        # Turns of one conversation run one after another; different sessions run concurrently
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class SessionManager:
+    """
+    In-memory registry of open conversations for the chat service.
+
+    A session holds the tail-loaded chat history and the conversation memory of
+    one session id. Sessions idle for longer than idle_ttl seconds are evicted by
+    a periodic sweep, and the least recently used idle session is evicted when
+    more than max_active are open; evicted sessions are reopened from disk.
+    """
+
+    def __init__(self, idle_ttl: float = SESSION_IDLE_TTL,
+                 max_active: int = SESSION_MAX_ACTIVE,
+                 sweep_interval: float = SESSION_SWEEP_INTERVAL):
+        self.idle_ttl = idle_ttl
+        self.max_active = max_active
+        self.sweep_interval = sweep_interval
+        self._sessions: Dict[str, Session] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def new_session_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def get(self, session_id: str) -> Session:
+        """Return the open session, opening it (and its history on disk) if needed."""
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._open(session_id, JSONLChatMessageHistory(session_id))
+        session.last_used = time.monotonic()
+        return session
+
+    async def aget(self, session_id: str) -> Session:
+        """get() for the event loop: the history of a session not open yet is read on a worker thread."""
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        if session_id not in self._sessions:
+            chat_store = await asyncio.to_thread(JSONLChatMessageHistory, session_id)
+            # Another request may have opened it meanwhile
+            if session_id not in self._sessions:
+                self._open(session_id, chat_store)
+        return self.get(session_id)
+
+    def _open(self, session_id: str, chat_store: JSONLChatMessageHistory) -> Session:
+        session = Session(session_id, chat_store, ConversationMemory())
+        self._sessions[session_id] = session
+        self._evict_overflow()
+        return session
+
+    def close(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.memory.close()
+
+    def _evictable(self, session: Session) -> bool:
+        return not session.lock.locked()
+
+    def _evict_overflow(self) -> None:
+        if len(self._sessions) <= self.max_active:
+            return
+        idle = sorted(
+            (s for s in self._sessions.values() if self._evictable(s)),
+            key=lambda s: s.last_used,
+        )
+        for session in idle[:len(self._sessions) - self.max_active]:
+            self.close(session.session_id)
+
+    def evict_idle(self) -> int:
+        """Close sessions idle for longer than idle_ttl; returns how many were closed."""
+        deadline = time.monotonic() - self.idle_ttl
+        expired = [
+            session_id for session_id, session in self._sessions.items()
+            if session.last_used < deadline and self._evictable(session)
+        ]
+        for session_id in expired:
+            self.close(session_id)
+        if expired:
+            logger.info("Evicted %d idle sessions, %d open", len(expired), len(self._sessions))
+        return len(expired)
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.evict_idle()
+
+    def start(self) -> None:
+        """Start the periodic idle sweep on the running event loop."""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        for session_id in list(self._sessions):
+            self.close(session_id)
@@ -0,0 +1,71 @@
+import re
+from typing import Dict, Iterable, List, Optional
+
+from src.global_settings import (
+    SOURCES,
+    CHUNK_STORE_DIR,
+    VECTOR_COLLECTION,
+    LEXICAL_INDEX_FILE,
+    NUMPY_INDEX_DIR,
+    INDEX_VERSION_FILE,
+)
+
+# Also a valid Chroma collection name once prefixed
+_SOURCE_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]{0,40}$")
+
+
+class Source:
+    """
+    A named part of the corpus (DSM-5, ICD-11 excerpts, local guidelines, ...).
+
+    Every source has its own chunk store and its own shard of indexes, so it is
+    ingested and indexed without touching the other sources.
+    """
+
+    def __init__(self, name: str, files: Iterable[str]):
+        if not _SOURCE_NAME.match(name):
+            raise ValueError(f"Invalid source name: {name!r}")
+        self.name = name
+        self.files = list(files)
+
+    def __repr__(self) -> str:
+        return f"Source({self.name!r})"
+
+    @property
+    def chunk_store_dir(self) -> str:
+        return CHUNK_STORE_DIR.format(source=self.name)
+
+    @property
+    def collection_name(self) -> str:
+        return VECTOR_COLLECTION.format(source=self.name)
+
+    @property
+    def lexical_index_file(self) -> str:
+        return LEXICAL_INDEX_FILE.format(source=self.name)
+
+    @property
+    def numpy_index_dir(self) -> str:
+        return NUMPY_INDEX_DIR.format(source=self.name)
+
+    @property
+    def index_version_file(self) -> str:
+        return INDEX_VERSION_FILE.format(source=self.name)
+
+
+def get_sources() -> Dict[str, Source]:
+    """Configured sources by name, in SOURCES order."""
+    return {name: Source(name, files) for name, files in SOURCES.items()}
+
+
+def get_source(name: str) -> Source:
+    sources = get_sources()
+    if name not in sources:
+        raise ValueError(f"Unknown source: {name!r} (available: {', '.join(sources)})")
+    return sources[name]
+
+
+def select_sources(names: Optional[Iterable[str]] = None) -> List[Source]:
+    """The named sources, or all of them when names is None."""
+    if names is None:
+        return list(get_sources().values())
+    return [get_source(name) for name in names]
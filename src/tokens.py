@@ -0,0 +1,17 @@
+from functools import lru_cache
+
+try:
+    import tiktoken
+    _encoding = tiktoken.encoding_for_model("gpt-4o")
+except Exception:
+    # tiktoken missing or its encoding files unavailable offline
+    _encoding = None
+TOKENIZER_NAME = _encoding.name if _encoding is not None else "chars/4"
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Token count of a text, cached since history messages are counted every turn."""
+    if _encoding is None:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text))
@@ -0,0 +1,324 @@
+"""
+Structured tracing and metrics.
+
+Spans (turns, LLM and tool calls, embeddings, vector queries, file writes) are
+written as one JSON object per line to TRACE_FILE by a background thread, and
+their durations, token counts and cache hits are aggregated into in-process
+metrics that start_metrics_server() exposes in the Prometheus text format.
+
+    with span("vector_query", k=5) as s:
+        hits = backend.query(...)
+        s.set(hits=len(hits))
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.global_settings import TRACING_ENABLED, TRACE_FILE, METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets in seconds, spanning a cache hit to a slow LLM call
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics:
+    """Thread-safe counters and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._histograms: Dict[Tuple[str, tuple], list] = {}  # key -> [bucket counts, sum, count]
+
+    def increment(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()) -> str:
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (metric, labels), value in sorted(self._counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{self._labels(labels)} {value}")
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), (counts, total, count) in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, bucket_count in zip(self.buckets, counts):
+                        lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {bucket_count}")
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {total}")
+                    lines.append(f"{name}_count{self._labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class TraceWriter:
+    """Appends finished spans to a JSONL file from a background thread."""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._queue: "queue.SimpleQueue[Optional[dict]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+        self._queue.put(record)
+
+    def _run(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                record = self._queue.get()
+                # Drain whatever else is queued so a burst of spans is one write
+                batch = [record]
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                done = None in batch
+                f.write("".join(
+                    json.dumps(item, ensure_ascii=False, default=str) + "\n"
+                    for item in batch if item is not None
+                ))
+                f.flush()
+                if done:
+                    return
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+_writer = TraceWriter()
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed operation; ended spans are exported to the trace file and metrics."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "_start", "_wall_start", "_ended")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes: Dict[str, Any] = attributes
+        self._wall_start = time.time()
+        self._start = time.perf_counter()
+        self._ended = False
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def set(self, **attributes) -> "Span":
+        self.attributes.update(attributes)
+        return self
+
+    def end(self, error: Optional[BaseException] = None) -> float:
+        duration = time.perf_counter() - self._start
+        if self._ended:
+            return duration
+        self._ended = True
+        status = "error" if error is not None else "ok"
+        metrics.observe("mindcare_span_duration_seconds", duration, span=self.name, status=status)
+        if TRACING_ENABLED:
+            record = {
+                "name": self.name,
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "start": self._wall_start,
+                "duration_ms": duration * 1000,
+                "status": status,
+                "attributes": self.attributes,
+            }
+            if error is not None:
+                record["error"] = f"{type(error).__name__}: {error}"
+            _writer.write(record)
+        return duration
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, parent: Optional[Span] = None, **attributes) -> Span:
+    """Start a span without making it current; the caller must end() it."""
+    return Span(name, parent if parent is not None else _current_span.get(), **attributes)
+
+
+@contextmanager
+def use_span(active: Span):
+    """Make an already started span the parent of spans opened inside the block."""
+    token = _current_span.set(active)
+    try:
+        yield active
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time the block as a child of the current span."""
+    active = start_span(name, **attributes)
+    token = _current_span.set(active)
+    try:
+        yield active
+    except BaseException as e:
+        active.end(error=e)
+        raise
+    else:
+        active.end()
+    finally:
+        _current_span.reset(token)
+
+
+def record_cache(cache: str, hit: bool, count: int = 1) -> None:
+    """Count cache lookups by cache name and result."""
+    if count:
+        metrics.increment("mindcare_cache_requests_total", count, cache=cache, result="hit" if hit else "miss")
+
+
+def _token_usage(response) -> Dict[str, int]:
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return {"input_tokens": usage.get("input_tokens", 0), "output_tokens": usage.get("output_tokens", 0)}
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return {"input_tokens": usage.get("prompt_tokens", 0), "output_tokens": usage.get("completion_tokens", 0)}
+    return {}
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler that turns LLM and tool runs into spans under a
+    parent span (normally the turn), recording model names and token counts.
+    """
+
+    run_inline = True
+
+    def __init__(self, parent: Optional[Span] = None):
+        self.parent = parent
+        self._spans: Dict[Any, Span] = {}
+
+    def _start(self, run_id, parent_run_id, name: str, **attributes) -> None:
+        parent = self._spans.get(parent_run_id, self.parent)
+        self._spans[run_id] = start_span(name, parent=parent, **attributes)
+
+    def _end(self, run_id, error: Optional[BaseException] = None, **attributes) -> Optional[Span]:
+        active = self._spans.pop(run_id, None)
+        if active is not None:
+            active.set(**attributes).end(error=error)
+        return active
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name")
+        self._start(run_id, parent_run_id, "llm", model=model, messages=sum(len(batch) for batch in messages))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name")
+        self._start(run_id, parent_run_id, "llm", model=model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = _token_usage(response)
+        active = self._end(run_id, **usage)
+        model = active.attributes.get("model") if active is not None else None
+        for kind, count in usage.items():
+            metrics.increment("mindcare_llm_tokens_total", count, model=model, kind=kind)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "tool", tool=(serialized or {}).get("name"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, output_chars=len(str(output)))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> bool:
+    """Serve GET /metrics on host:port from a daemon thread; returns False if the port is taken."""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return True
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning("Metrics server not started on port %s: %s", port, e)
+            return False
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info("Metrics served at http://%s:%s/metrics", host, port)
+        return True
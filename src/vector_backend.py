@@ -0,0 +1,198 @@
+import os
+import json
+import shutil
+from typing import Dict, List, Optional
+import numpy as np
+
+from src.global_settings import VECTOR_BACKEND, NUMPY_INDEX_DTYPE
+from src.resources import get_resource, drop_resource, get_collection
+from src.index_version import IndexVersionWatcher
+from src.sources import Source
+
+VECTORS_NAME = "vectors.npy"
+SCALES_NAME = "scales.npy"
+ROWS_NAME = "rows.json"
+
+
+class ChromaBackend:
+    """Vector search through the persistent Chroma collection (HNSW)."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def query(self, query_embeddings: List[List[float]], k: int = 5) -> List[List[dict]]:
+        """
+        Return, for each query embedding, up to k hits (dicts with id, text,
+        metadata and score = cosine similarity), best first.
+        """
+        results = self.collection.query(query_embeddings=query_embeddings, n_results=k)
+        return [
+            [
+                {"id": doc_id, "text": text, "metadata": metadata or {}, "score": 1.0 - distance}
+                for doc_id, text, metadata, distance in zip(ids, texts, metadatas, distances)
+            ]
+            for ids, texts, metadatas, distances in zip(
+                results["ids"], results["documents"], results["metadatas"], results["distances"]
+            )
+        ]
+
+    def embeddings(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Stored vectors of the given chunk ids."""
+        stored = self.collection.get(ids=ids, include=["embeddings"])
+        return {
+            doc_id: np.asarray(vector, dtype=np.float32)
+            for doc_id, vector in zip(stored["ids"], stored["embeddings"])
+        }
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def write_numpy_index(ids: List[str], vectors, texts: List[str], metadatas: List[dict],
+                      path: str, dtype: str = NUMPY_INDEX_DTYPE) -> None:
+    """
+    Write a normalized embedding matrix for NumpyBackend.
+
+    dtype is "float32", "float16" or "int8"; int8 rows are stored with a float32
+    per-row scale so scores can be recovered as (row @ query) * scale.
+
+    The files are written to a temporary directory that then replaces path, so a
+    running NumpyBackend keeps its memory map of the old files, which stay
+    consistent with its ids and texts.
+    """
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        _write_files(ids, vectors, texts, metadatas, tmp_path, dtype)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    # Unlinking a mapped file is safe: the mapping keeps the old data alive
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _write_files(ids, vectors, texts, metadatas, path: str, dtype: str) -> None:
+    matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        stored = np.round(matrix / scales[:, None]).astype(np.int8)
+        np.save(os.path.join(path, SCALES_NAME), scales.astype(np.float32))
+    elif dtype in ("float32", "float16"):
+        stored = matrix.astype(dtype)
+    else:
+        raise ValueError(f"Unknown index dtype: {dtype!r}")
+    np.save(os.path.join(path, VECTORS_NAME), stored)
+    with open(os.path.join(path, ROWS_NAME), "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "texts": texts, "metadatas": metadatas, "dtype": dtype}, f, ensure_ascii=False)
+
+
+class NumpyBackend:
+    """
+    Exact in-process vector search over a memory-mapped, normalized embedding matrix.
+
+    For a corpus of a few hundred chunks one matrix product is cheaper than an
+    HNSW lookup, and batches of queries are answered with a single product.
+
+    A float16 or int8 index is smaller on disk, but NumPy has no fast matrix
+    product for those types, so it is decoded to float32 once, on first search.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, ROWS_NAME), "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        self.ids = rows["ids"]
+        self.texts = rows["texts"]
+        self.metadatas = rows["metadatas"]
+        self.dtype = rows["dtype"]
+        self.matrix = np.load(os.path.join(path, VECTORS_NAME), mmap_mode="r")
+        if self.matrix.shape[0] != len(self.ids):
+            raise ValueError(f"NumPy index at {path} has {self.matrix.shape[0]} vectors for {len(self.ids)} rows")
+        self.scales: Optional[np.ndarray] = None
+        if self.dtype == "int8":
+            self.scales = np.load(os.path.join(path, SCALES_NAME))
+
+    def embeddings(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Stored (normalized) vectors of the given chunk ids."""
+        if not hasattr(self, "_positions"):
+            self._positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        vectors = {}
+        for doc_id in ids:
+            i = self._positions.get(doc_id)
+            if i is not None:
+                row = np.asarray(self.matrix[i], dtype=np.float32)
+                vectors[doc_id] = row * self.scales[i] if self.scales is not None else row
+        return vectors
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the stored index (the float32 search matrix is not counted)."""
+        return self.matrix.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _search_matrix(self) -> np.ndarray:
+        if not hasattr(self, "_decoded"):
+            if self.dtype == "float32":
+                self._decoded = self.matrix
+            elif self.scales is not None:
+                self._decoded = np.asarray(self.matrix, dtype=np.float32) * self.scales[:, None]
+            else:
+                self._decoded = np.asarray(self.matrix, dtype=np.float32)
+        return self._decoded
+
+    def scores(self, query_embeddings) -> np.ndarray:
+        queries = _normalize(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        return queries @ self._search_matrix().T
+
+    def query(self, query_embeddings: List[List[float]], k: int = 5) -> List[List[dict]]:
+        """Same contract as ChromaBackend.query."""
+        scores = self.scores(query_embeddings)
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            return [[] for _ in range(scores.shape[0])]
+        # argpartition finds the top k in linear time; only those k are sorted
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row_scores, candidates in zip(scores, top):
+            order = candidates[np.argsort(-row_scores[candidates])]
+            results.append([
+                {
+                    "id": self.ids[i],
+                    "text": self.texts[i],
+                    "metadata": self.metadatas[i],
+                    "score": float(row_scores[i]),
+                }
+                for i in order
+            ])
+        return results
+
+
+def _build_backend(source: Source):
+    if VECTOR_BACKEND == "numpy":
+        return NumpyBackend(source.numpy_index_dir)
+    if VECTOR_BACKEND == "chroma":
+        return ChromaBackend(get_collection(source.collection_name))
+    raise ValueError(f"Unknown vector backend: {VECTOR_BACKEND!r}")
+
+
+def get_vector_backend(source: Source):
+    """
+    Process-wide vector backend of a source's shard, selected by VECTOR_BACKEND.
+    It is reopened once build_indexes records a new index version for the source.
+    """
+    watcher = get_resource(
+        f"vector_backend_version:{source.name}", lambda: IndexVersionWatcher(source.index_version_file)
+    )
+    if watcher.changed():
+        drop_resource(f"vector_backend:{source.name}")
+        # The collection may have been recreated by the rebuild
+        drop_resource(f"collection:{source.collection_name}")
+    return get_resource(f"vector_backend:{source.name}", lambda: _build_backend(source))
@@ -1,4 +1,24 @@
+import logging
 import streamlit as st
+from dotenv import load_dotenv
+from src.conversation_engine import warm_up
+from src.tracing import start_metrics_server
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+
+@st.cache_resource(show_spinner=False)
+def warm_up_resources():
+    # Chạy một lần cho mỗi tiến trình: nạp index, LLM client và agent dùng chung
+    start_metrics_server()
+    try:
+        warm_up()
+    except Exception as e:
+        logger.warning("Warm-up failed: %s", e)
+    return True
+
 
 home_page = st.Page("Home.py", title="Home", icon=":material/home:")
 user_page = st.Page("User.py", title="User", icon=":material/analytics:")
@@ -15,4 +35,5 @@ st.set_page_config(
     page_icon="🧠",
     layout="wide",
 )
+warm_up_resources()
 pg.run()
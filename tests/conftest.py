@@ -0,0 +1,33 @@
+import os
+
+# Keep test runs out of data/traces
+os.environ.setdefault("TRACING_ENABLED", "0")
+
+import pytest  # noqa: E402
+
+from src.sources import Source  # noqa: E402
+
+
+class TmpSource(Source):
+    """A source whose indexes live under a temporary directory."""
+
+    def __init__(self, root: str, name: str = "test"):
+        super().__init__(name, [])
+        self.root = root
+
+    @property
+    def numpy_index_dir(self) -> str:
+        return os.path.join(self.root, "numpy")
+
+    @property
+    def lexical_index_file(self) -> str:
+        return os.path.join(self.root, "lexical_index.json")
+
+    @property
+    def index_version_file(self) -> str:
+        return os.path.join(self.root, "index_version")
+
+
+@pytest.fixture
+def tmp_source(tmp_path):
+    return TmpSource(str(tmp_path))
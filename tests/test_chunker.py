@@ -0,0 +1,89 @@
+import os
+import json
+
+import pytest
+from langchain.docstore.document import Document
+
+from src.chunker import TokenCountCache, is_code_line, iter_sections
+
+# Pages of data/ingestion_storage/dsm-5-cac-tieu-chuan-chan-doan.pdf as extracted by the parser
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "dsm5_pages.json")
+
+
+@pytest.fixture
+def sections(tmp_path):
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        pages = json.load(f)
+    documents = [
+        Document(page_content=page["text"], metadata={"id": "dsm5", "page": page["page"]})
+        for page in pages
+    ]
+    return list(iter_sections(documents, TokenCountCache(path=str(tmp_path / "token_counts.json"))))
+
+
+def test_numbered_title_is_joined_with_its_code_line(sections):
+    titles = [section.title for section in sections]
+    assert "1.2.2 Rối loạn phát âm Mã số: 315.39 (F80.0)" in titles
+    assert "1.6.3.1 Rối loạn Tourette Mã số: 307.23 (F95.2)" in titles
+
+
+def test_disorder_name_starts_its_own_section(sections):
+    for section in sections:
+        # The title of the next disorder never trails the previous section
+        assert not section.lines[-1].text.startswith("1.2.2 ")
+    no_code = next(section for section in sections if section.title.startswith("1.2.3 "))
+    assert no_code.title == "1.2.3 Rối loạn giao tiếp xã hội"
+
+
+def test_wrapped_title_lines_are_joined(sections):
+    titles = [section.title for section in sections]
+    assert (
+        "1.6.3.2 Rối loạn tic vận động và lời nói mạn tính (Persistent/Chronic Motor or "
+        "Vocal Tic Disorder) Mã số: 307.22 (F95.1)"
+    ) in titles
+
+
+def test_sections_with_the_same_code_get_their_own_title(sections):
+    catatonia = [section for section in sections if section.page_start == 14 and "(F06.1)" in section.title]
+    assert [section.title.split(" ", 1)[0] for section in catatonia] == ["1.15.1", "1.15.2"]
+
+
+def test_no_title_is_a_bare_code_line_or_running_text(sections):
+    for section in sections:
+        assert section.title
+        assert not is_code_line(section.title)
+        assert not section.title[0].islower()
+
+
+def test_running_text_starting_with_chung_stays_in_its_section(sections):
+    containing = [
+        section for section in sections
+        if any(line.text.startswith("chứng (đặc biệt") for line in section.lines)
+    ]
+    assert len(containing) == 1
+    assert containing[0].title.startswith("1.16.2 ")
+    assert not containing[0].lines[0].text.startswith("chứng")
+
+
+def test_every_line_is_kept(sections):
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        pages = json.load(f)
+    expected = sum(
+        1 for page in pages for line in page["text"].splitlines()
+        if line.strip() and not line.strip().isdigit()
+    )
+    assert sum(len(section.lines) for section in sections) == expected
+
+
+def test_section_ids_are_unique(sections, tmp_path):
+    ids = [section.id for section in sections]
+    assert len(set(ids)) == len(ids)
+
+    # Two sections on one page under the same code line
+    page = Document(
+        page_content="Mã số: 293.89 (F06.1)\nA. Triệu chứng thứ nhất.\nMã số: 293.89 (F06.1)\nA. Triệu chứng thứ hai.",
+        metadata={"id": "dsm5", "page": 14},
+    )
+    same_title = list(iter_sections([page], TokenCountCache(path=str(tmp_path / "same_title.json"))))
+    assert [section.title for section in same_title] == ["Mã số: 293.89 (F06.1)"] * 2
+    assert same_title[0].id != same_title[1].id
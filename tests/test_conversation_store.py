@@ -0,0 +1,47 @@
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.conversation_store import JSONLChatMessageHistory, _read_tail_lines
+
+
+def test_read_tail_lines_at_every_block_boundary(tmp_path):
+    path = tmp_path / "history.jsonl"
+    lines = [f"line {i:02d}".encode() for i in range(15)]
+    path.write_bytes(b"".join(line + b"\n" for line in lines))
+    for limit in range(1, 17):
+        for block_size in range(1, 40):
+            assert _read_tail_lines(str(path), limit, block_size) == lines[-limit:], (limit, block_size)
+
+
+def test_compaction_archives_old_records_and_drops_torn_lines(tmp_path):
+    history = JSONLChatMessageHistory("s1", root=str(tmp_path), fsync="never", compact_every=1000, keep=4)
+    history.add_messages([HumanMessage(content=f"q{i}") for i in range(10)])
+    # A crash in the middle of an append, then the session is reopened
+    with open(history.path, "ab") as f:
+        f.write(b'{"role": "user", "cont')
+    history = JSONLChatMessageHistory("s1", root=str(tmp_path), fsync="never", compact_every=1000, keep=4)
+    history.add_messages([AIMessage(content="a")])
+    history.compact()
+
+    with open(history.path, encoding="utf-8") as f:
+        live = [json.loads(line)["content"] for line in f]
+    with open(history.archive_path, encoding="utf-8") as f:
+        archived = [json.loads(line)["content"] for line in f]
+    assert live == ["q7", "q8", "q9", "a"]
+    assert archived == [f"q{i}" for i in range(7)]
+
+
+def test_legacy_history_is_migrated_once(tmp_path):
+    legacy = tmp_path / "chat_history.json"
+    legacy.write_text(json.dumps({"messages": [
+        {"role": "user", "content": "Chào bạn"},
+        {"role": "assistant", "content": "Chào bạn, mình có thể giúp gì?"},
+    ]}), encoding="utf-8")
+    history = JSONLChatMessageHistory("default", root=str(tmp_path / "conversations"), fsync="never")
+    assert history.migrate_json(str(legacy)) == 2
+    assert not legacy.exists()
+
+    reopened = JSONLChatMessageHistory("default", root=str(tmp_path / "conversations"))
+    assert [message.content for message in reopened.messages] == ["Chào bạn", "Chào bạn, mình có thể giúp gì?"]
+    assert isinstance(reopened.messages[1], AIMessage)
@@ -0,0 +1,34 @@
+from langchain.agents import AgentExecutor, create_openai_tools_agent
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.tools import tool
+
+from src.providers import FakeChatModel, RecordReplayChatModel, RecordReplayStore
+
+
+@tool
+def dsm5_query(query: str) -> str:
+    """Tra cứu tiêu chuẩn chẩn đoán DSM-5."""
+    return "Tiêu chuẩn A. Khí sắc trầm gần như cả ngày."
+
+
+def _agent_turn(llm) -> str:
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Bạn là trợ lý."),
+        ("human", "{input}"),
+        MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ])
+    agent = create_openai_tools_agent(llm, [dsm5_query], prompt)
+    executor = AgentExecutor(agent=agent, tools=[dsm5_query])
+    return executor.invoke({"input": "Tiêu chuẩn trầm cảm là gì?"})["output"]
+
+
+def test_agent_turn_replays_after_recording(tmp_path):
+    store = RecordReplayStore(str(tmp_path / "recordings.db"))
+    recorder = RecordReplayChatModel(
+        inner=FakeChatModel(tool_call="dsm5_query"), store=store, model_name="fake"
+    )
+    recorded = _agent_turn(recorder)
+
+    # The tool-calling step gets a fresh run id on replay; it must not change the key
+    replayer = RecordReplayChatModel(store=store, model_name="fake", replay_only=True)
+    assert _agent_turn(replayer) == recorded
@@ -0,0 +1,73 @@
+import time
+import threading
+
+from src import vector_backend
+from src.lexical_index import BM25Index
+from src.providers import FakeEmbeddings
+from src.resources import clear_resources
+from src.retrieval import HybridRetriever, Shard, SourceShard
+from src.vector_backend import NumpyBackend, write_numpy_index
+
+TEXTS = [
+    "Rối loạn trầm cảm chủ yếu: khí sắc trầm gần như cả ngày",
+    "Rối loạn lo âu lan tỏa: lo âu quá mức nhiều ngày",
+    "Rối loạn mất ngủ: khó bắt đầu hoặc duy trì giấc ngủ",
+]
+
+
+def _write(source, ids, version):
+    embeddings = FakeEmbeddings(dimension=64)
+    write_numpy_index(ids, embeddings.embed_documents(TEXTS[:len(ids)]), TEXTS[:len(ids)],
+                      [{} for _ in ids], path=source.numpy_index_dir)
+    BM25Index().build(ids, TEXTS[:len(ids)]).save(source.lexical_index_file)
+    with open(source.index_version_file, "w", encoding="utf-8") as f:
+        f.write(version)
+
+
+def test_source_shard_reloads_lexical_index_on_new_version(tmp_source, monkeypatch):
+    monkeypatch.setattr(vector_backend, "VECTOR_BACKEND", "numpy")
+    clear_resources()
+    _write(tmp_source, ["old-0", "old-1", "old-2"], "v1")
+    retriever = HybridRetriever([SourceShard(tmp_source)], FakeEmbeddings(dimension=64), mode="lexical")
+    assert retriever.search("mất ngủ", k=1)[0]["id"] == "old-2"
+
+    _write(tmp_source, ["new-0", "new-1"], "v2")
+    ids = {hit["id"] for hit in retriever.search("rối loạn", k=5)}
+    assert ids == {"new-0", "new-1"}
+    clear_resources()
+
+
+class _SignallingIndex(BM25Index):
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+
+    def search(self, query, k=5):
+        self.started.set()
+        return super().search(query, k)
+
+
+class _WaitForLexicalEmbeddings(FakeEmbeddings):
+    """Returns once the lexical search has started, or after a second."""
+
+    def __init__(self, index):
+        super().__init__(dimension=64)
+        self.index = index
+
+    def embed_query(self, text):
+        self.index.started.wait(1.0)
+        return super().embed_query(text)
+
+
+def test_lexical_search_runs_while_query_is_embedded(tmp_path):
+    ids = ["a", "b", "c"]
+    write_numpy_index(ids, FakeEmbeddings(dimension=64).embed_documents(TEXTS), TEXTS, [{} for _ in ids],
+                      path=str(tmp_path / "numpy"))
+    index = _SignallingIndex().build(ids, TEXTS)
+    shard = Shard("test", NumpyBackend(str(tmp_path / "numpy")), index)
+    retriever = HybridRetriever([shard], _WaitForLexicalEmbeddings(index), embed_timeout=5.0)
+
+    start = time.perf_counter()
+    hits = retriever.search("khí sắc trầm", k=2)
+    assert time.perf_counter() - start < 0.5
+    assert hits[0]["id"] == "a"
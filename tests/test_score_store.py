@@ -0,0 +1,31 @@
+import json
+
+from src.global_settings import DEFAULT_USER_ID
+from src.score_store import ScoreStore
+
+
+def test_legacy_scores_are_migrated_to_the_default_user(tmp_path):
+    legacy = tmp_path / "scores.json"
+    legacy.write_text(json.dumps([
+        {"Time": "2024-01-02 08:00:00", "Score": 12, "Level": "kém", "Content": "c", "Total guess": "g"},
+        {"Time": "2024-01-01 08:00:00", "Score": 30, "Level": "tốt"},
+    ]), encoding="utf-8")
+    store = ScoreStore(str(tmp_path / "scores.db"), legacy_json=str(legacy))
+
+    assert [entry["Score"] for entry in store.range(DEFAULT_USER_ID)] == [30, 12]
+    assert not legacy.exists()
+    # Opening the store again does not import twice
+    reopened = ScoreStore(str(tmp_path / "scores.db"), legacy_json=str(legacy))
+    assert len(reopened.range(DEFAULT_USER_ID)) == 2
+
+
+def test_range_includes_the_whole_end_date(tmp_path):
+    store = ScoreStore(str(tmp_path / "scores.db"), legacy_json=None)
+    for time in ("2024-01-30 23:00:00", "2024-01-31 09:00:00", "2024-01-31 23:59:59", "2024-02-01 00:00:00"):
+        store.add(DEFAULT_USER_ID, 20, "trung bình", "", "", time=time)
+    store.add("other", 20, "trung bình", "", "", time="2024-01-31 10:00:00")
+
+    times = [entry["Time"] for entry in store.range(DEFAULT_USER_ID, start="2024-01-31", end="2024-01-31")]
+    assert times == ["2024-01-31 09:00:00", "2024-01-31 23:59:59"]
+    assert len(store.range(DEFAULT_USER_ID, end="2024-01")) == 3
+    assert len(store.range(DEFAULT_USER_ID, end="2024-01-31 09:00:00")) == 2
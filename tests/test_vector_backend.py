@@ -0,0 +1,41 @@
+import numpy as np
+
+from src import vector_backend
+from src.resources import clear_resources
+from src.vector_backend import NumpyBackend, get_vector_backend, write_numpy_index
+
+
+def _write(source, size: int, version: str) -> np.ndarray:
+    vectors = np.random.default_rng(size).normal(size=(size, 32)).astype(np.float32)
+    ids = [f"{version}-{i}" for i in range(size)]
+    write_numpy_index(ids, vectors, ids, [{} for _ in ids], path=source.numpy_index_dir)
+    with open(source.index_version_file, "w", encoding="utf-8") as f:
+        f.write(version)
+    return vectors
+
+
+def test_rebuild_keeps_open_backend_consistent(tmp_source):
+    source = tmp_source
+    vectors = _write(source, 500, "v1")
+    backend = NumpyBackend(source.numpy_index_dir)
+
+    # A smaller rebuild must not touch the files the open backend has mapped
+    _write(source, 5, "v2")
+    hits = backend.query([vectors[0].tolist()], k=3)[0]
+    assert hits[0]["id"] == "v1-0"
+    assert hits[0]["text"] == "v1-0"
+
+
+def test_backend_is_reopened_on_new_index_version(tmp_source, monkeypatch):
+    monkeypatch.setattr(vector_backend, "VECTOR_BACKEND", "numpy")
+    clear_resources()
+    source = tmp_source
+    _write(source, 20, "v1")
+    first = get_vector_backend(source)
+    assert get_vector_backend(source) is first
+
+    vectors = _write(source, 8, "v2")
+    second = get_vector_backend(source)
+    assert second is not first
+    assert second.query([vectors[0].tolist()], k=1)[0][0]["id"] == "v2-0"
+    clear_resources()